@@ -1,191 +1,443 @@
-from datetime import datetime
 import os
 import json
 import random
-import requests
 from dotenv import load_dotenv
-import math
-import time 
-import heapq
-from heuristic import get_score
-import concurrent.futures
+from heuristic import score_rows, score_matrix, LoadClusters, iso_to_micros
 import asyncio
 from gmqtt import Client as MQTTClient
 import signal 
-from redis_store import store
+from redis_store import store, month_of
+from spatial_index import FleetIndex
+from distance_provider import make_distance_provider
+from ingest import IngestQueue
+from registry import Registry
+from stats import stats
+from columnar import ColumnStore
+from assignment import ASSIGNERS, LoadWindow
+from snapshot import prefixed, unprefixed, read_snapshot, write_snapshot, MAX_AGE
+import logging
+import numpy as np
 
 load_dotenv() 
-trucks = {}
-loads = {}
+# numeric truck and load state lives in columns (timestamps as epoch seconds),
+# the registries below only keep ids, expiry and the non-numeric leftovers
+truck_table = ColumnStore({"positionLatitude": np.float64, "positionLongitude": np.float64, "equipType": np.int16, "nextTripLengthPreference": np.int8, "firstSeen": np.float64, "latestNotification": np.float64, "cooldownUntil": np.float64}, categorical=("equipType", "nextTripLengthPreference"))
+load_table = ColumnStore({"originLatitude": np.float64, "originLongitude": np.float64, "destinationLatitude": np.float64, "destinationLongitude": np.float64, "price": np.float64, "mileage": np.float64, "equipmentType": np.int16, "createdAt": np.float64}, categorical=("equipmentType",))
+truck_index = FleetIndex()
+# open loads by origin, for matching trucks as they move
+load_index = FleetIndex()
+load_clusters = LoadClusters()
 
+def forget_truck(truck_id, truck, reason):
+    truck_index.remove(truck_id)
+    truck_table.remove(truck_id)
+
+def forget_load(load_id, load, reason):
+    load_index.remove(load_id)
+    load_table.remove(load_id)
+    load_clusters.mark_dirty()
+
+# trucks that stop reporting and loads nobody picked up age out on event time
+trucks = Registry(
+    ttl=float(os.getenv("TRUCK_TTL_SECONDS", "43200")),
+    max_size=int(os.getenv("TRUCK_MAX_SIZE", "200000")),
+    on_evict=forget_truck,
+)
+loads = Registry(
+    ttl=float(os.getenv("LOAD_TTL_SECONDS", "21600")),
+    max_size=int(os.getenv("LOAD_MAX_SIZE", "100000")),
+    on_evict=forget_load,
+)
+# drop a load as soon as it has been offered, instead of keeping it open for clustering until it expires
+REMOVE_NOTIFIED_LOADS = os.getenv("REMOVE_NOTIFIED_LOADS", "0") == "1"
+# on a Truck position update, offer the best nearby open load (opt-in)
+REVERSE_MATCHING = os.getenv("REVERSE_MATCHING", "0") == "1"
+REVERSE_MATCH_LOADS = int(os.getenv("REVERSE_MATCH_LOADS", "10"))
+REVERSE_MATCH_MILES = float(os.getenv("REVERSE_MATCH_MILES", "250"))
+# a notified truck is not offered another load for this long
+NOTIFY_COOLDOWN_SECONDS = float(os.getenv("NOTIFY_COOLDOWN_SECONDS", "1800"))
+# set by shard workers: a border truck is held by several of them, so its cooldown is claimed in redis
+shared_cooldown = False
+# collect loads for this long (or this many) and match them together, 0 matches each load on arrival
+LOAD_BATCH_WINDOW_MS = float(os.getenv("LOAD_BATCH_WINDOW_MS", "0"))
+LOAD_BATCH_MAX_LOADS = int(os.getenv("LOAD_BATCH_MAX_LOADS", "50"))
+LOAD_BATCH_OFFERS = int(os.getenv("LOAD_BATCH_OFFERS", "20"))
+LOAD_BATCH_ASSIGNMENT = os.getenv("LOAD_BATCH_ASSIGNMENT", "hungarian")
+distance_provider = make_distance_provider()
+
+# event clock: the newest timestamp seen today, as sent and as epoch seconds
 latestTimestamp = ""
+latestEventTime = 0.0
 
 def on_connect(client, userdata, flags, rc):
     print("Connected with result code "+str(rc))
     client.subscribe("CodeJam")
 
-def on_message(client, topic, payload, qos, properties):
+async def on_message(client, topic, payload, qos, properties):
+    # hand the event to the matching workers and return to the MQTT loop
+    with stats.timer("decode"):
+        payload = json.loads(payload.decode())
+        # parse the timestamp once, everything downstream compares epoch seconds
+        payload["eventTime"] = iso_to_micros(payload["timestamp"]) / 1e6
+    stats.incr("events_total", type=payload.get("type"))
+    await ingest.put(payload)
+
+async def handle_event(payload):
+    with stats.profiler.sample():
+        await dispatch_event(payload)
+
+async def dispatch_event(payload):
     # send truck events to truck function
-    payload = json.loads(payload.decode())
-    global latestTimestamp 
-    latestTimestamp = payload["timestamp"]
+    global latestTimestamp, latestEventTime
+    # late events (reordered by the ingest workers or shards) don't move the clock back
+    if payload["eventTime"] >= latestEventTime:
+        latestTimestamp = payload["timestamp"]
+        latestEventTime = payload["eventTime"]
+    trucks.expire(latestEventTime)
+    loads.expire(latestEventTime)
     if(payload["type"] == "Truck"):
-        init_truck(payload)
+        await init_truck(payload)
         print("Truck " + str(payload["truckId"]) + " updated")
     elif(payload["type"] == "Load"):
-        init_load(payload)
+        await init_load(payload)
     elif(payload["type"] == "End"):
         print("End")
-        end_day()
+        if load_window is not None:
+            await load_window.flush()
+        end_day(clear_redis=not payload.get("replica"))
     elif(payload["type"] == "Start"):
         print("Start")
+    elif(payload["type"] == "ForgetTruck"):
+        # sent by the shard router when the truck moved out of this worker's regions
+        trucks.remove(payload["truckId"], "moved")
 
     else:
         print("Unknown type: " + payload["type"])
 
-def end_day():
+ingest = IngestQueue(
+    handle_event,
+    max_size=int(os.getenv("INGEST_MAX_SIZE", "10000")),
+    workers=int(os.getenv("INGEST_WORKERS", "1")),
+    policy=os.getenv("INGEST_POLICY", "drop_oldest"),
+    coalesce_trucks=os.getenv("INGEST_COALESCE_TRUCKS", "1") == "1",
+)
+
+def end_day(clear_redis=True):
+    global latestEventTime
+    latestEventTime = 0.0
     loads.clear()
     trucks.clear()
-    # clear redis
-    store.redis.flushall()
+    truck_table.clear()
+    load_table.clear()
+    truck_index.clear()
+    load_index.clear()
+    load_clusters.reset()
+    # clear redis (only once when the day is broadcast to several shards)
+    if clear_redis:
+        store.clear_trucks()
 
-def init_truck(payload):
+async def init_truck(payload):
     truck_id = payload["truckId"]
     if(truck_id not in trucks):
         #{'seq': 2140, 'type': 'Truck', 'timestamp': '2023-11-17T20:03:18', 'truckId': 104, 'positionLatitude': 40.84517288208008, 'positionLongitude': -73.91064453125, 'equipType': 'Van', 'nextTripLengthPreference': 'Long'}
-        trucks[truck_id] = {"seq": payload["seq"], "timestamp": payload["timestamp"], "positionLatitude": payload["positionLatitude"], "positionLongitude": payload["positionLongitude"], "equipType": payload["equipType"], "nextTripLengthPreference": payload["nextTripLengthPreference"], "latestNotification": payload["timestamp"], "latestLoads": []}
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps({"positionLatitude": payload["positionLatitude"], "positionLongitude": payload["positionLongitude"], "equipType": payload["equipType"], "nextTripLengthPreference": payload["nextTripLengthPreference"], "latestNotification": payload["timestamp"], "latestLoads": []}))
+        trucks.put(truck_id, {"seq": payload["seq"], "timestamp": payload["timestamp"], "latestLoads": []}, latestEventTime)
+        truck_table.insert(truck_id, positionLatitude=payload["positionLatitude"], positionLongitude=payload["positionLongitude"], equipType=payload["equipType"], nextTripLengthPreference=payload["nextTripLengthPreference"], firstSeen=latestEventTime, latestNotification=latestEventTime)
+        truck_index.add(truck_id, payload["equipType"], payload["positionLatitude"], payload["positionLongitude"])
+        if shared_cooldown:
+            adopt_truck(truck_id, payload)
+            return
+        pipe = store.pipeline()
+        store.set_truck(truck_id, {"positionLatitude": payload["positionLatitude"], "positionLongitude": payload["positionLongitude"], "equipType": payload["equipType"], "nextTripLengthPreference": payload["nextTripLengthPreference"], "latestNotification": payload["timestamp"]}, pipe)
+        store.reset_latest_loads(truck_id, pipe)
+        with stats.timer("redis_write"):
+            pipe.execute()
+    else:
+        # still reporting, keep it alive and follow it
+        trucks.touch(truck_id, latestEventTime)
+        preference_changed = truck_table.get(truck_id, "nextTripLengthPreference") != payload["nextTripLengthPreference"]
+        moved = truck_table.get(truck_id, "positionLatitude") != payload["positionLatitude"] or truck_table.get(truck_id, "positionLongitude") != payload["positionLongitude"]
+        truck_table.update(truck_id, nextTripLengthPreference=payload["nextTripLengthPreference"], positionLatitude=payload["positionLatitude"], positionLongitude=payload["positionLongitude"])
+        if (moved or preference_changed) and not payload.get("replica"):
+            store.set_truck(truck_id, {"positionLatitude": payload["positionLatitude"], "positionLongitude": payload["positionLongitude"], "nextTripLengthPreference": payload["nextTripLengthPreference"]})
+        if not moved:
+            return
+        truck_index.add(truck_id, truck_table.get(truck_id, "equipType"), payload["positionLatitude"], payload["positionLongitude"])
+        if REVERSE_MATCHING:
+            await match_truck(truck_id)
+
+def adopt_truck(truck_id, payload):
+    """Sharded: a truck new to this worker may be one another worker held until it
+    jumped, was forgotten or the matcher restarted, so its dashboard history and
+    idle time come from redis rather than being reset like a new truck's."""
+    # a border copy of a truck owned by another shard only reads, the owner keeps its redis state
+    with stats.timer("redis_write"):
+        notified = store.adopt_truck(truck_id, {"positionLatitude": payload["positionLatitude"], "positionLongitude": payload["positionLongitude"], "equipType": payload["equipType"], "nextTripLengthPreference": payload["nextTripLengthPreference"]},
+                                     payload["timestamp"], write=not payload.get("replica"))
+    if notified is not None:
+        truck_table.update(truck_id, latestNotification=iso_to_micros(notified) / 1e6)
 
-def init_load(payload):
+async def init_load(payload):
     load_id = payload["loadId"]
     # {'seq': 51, 'type': 'Load', 'timestamp': '2023-11-17T08:55:55', 'loadId': 40022, 'originLatitude': 29.9561, 'originLongitude': -90.0773, 'destinationLatitude': 33.6821, 'destinationLongitude': -84.1488, 'equipmentType': 'Flatbed', 'price': 1000.0, 'mileage': 480.0}
     if(load_id not in loads):
-        loads[load_id] = {"seq": payload["seq"], "timestamp": payload["timestamp"], "originLatitude": payload["originLatitude"], "originLongitude": payload["originLongitude"], "destinationLatitude": payload["destinationLatitude"], "destinationLongitude": payload["destinationLongitude"], "equipmentType": payload["equipmentType"], "price": payload["price"], "mileage": payload["mileage"], "potentialTrucks":{}}
-    dists = []
-    for truck_id, truck in trucks.items():
-        #Only push in heap compatible trucks (size) -> don't bother calculating the rest
-        if truck['equipType'] != payload['equipmentType']:
-            continue
-        distance = bird_fly_distance(truck['positionLatitude'], truck["positionLongitude"], payload['originLatitude'], payload["originLongitude"])
-        heapq.heappush(dists, (distance, truck_id))    
-    # get 50 closest trucks
-    for i in range(50):
-        if len(dists) == 0 or len(loads[load_id]["potentialTrucks"]) >= 20:
+        loads.put(load_id, {"seq": payload["seq"], "timestamp": payload["timestamp"], "potentialTrucks":{}, "offeredTo": set()}, latestEventTime)
+        load_table.insert(load_id, originLatitude=payload["originLatitude"], originLongitude=payload["originLongitude"], destinationLatitude=payload["destinationLatitude"], destinationLongitude=payload["destinationLongitude"], equipmentType=payload["equipmentType"], price=payload["price"], mileage=payload["mileage"], createdAt=latestEventTime)
+        load_index.add(load_id, payload["equipmentType"], payload["originLatitude"], payload["originLongitude"])
+        load_clusters.mark_dirty()
+    else:
+        loads.touch(load_id, latestEventTime)
+    if load_window is not None:
+        await load_window.add(load_id)
+        return
+    # get 20 closest compatible trucks (size) from the spatial index
+    with stats.timer("candidate_search"):
+        nearest = truck_index.nearest(payload['equipmentType'], payload['originLatitude'], payload["originLongitude"], 20)
+    # trucks still cooling down from an earlier offer don't need a distance either
+    nearest = [(distance, truck_id) for distance, truck_id in nearest if not in_cooldown(truck_id)]
+    for distance, truck_id in nearest:
+        if len(loads[load_id]["potentialTrucks"]) >= 20:
             break
-        truck_id = heapq.heappop(dists)[1]
         loads[load_id]["potentialTrucks"][truck_id] = -1
-    # get real distance between truck and load
-    start_time = time.time()
-    #print("start init_load with " + str(len(loads[load_id]["potentialTrucks"])) + " trucks")
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        future_list = []
-        for truck_id in loads[load_id]["potentialTrucks"].keys():
-            future = executor.submit(
-                        calculate_distance,
-                        trucks[truck_id]['positionLatitude'],
-                        trucks[truck_id]["positionLongitude"],
-                        payload['originLatitude'],
-                        payload["originLongitude"]
-                    )
-            future_list.append(future)
-    # Wait for all threads to finish
-    concurrent.futures.wait(future_list)
-    # Get the results
-    for i, truck_id in enumerate(loads[load_id]["potentialTrucks"].keys()):
-        loads[load_id]["potentialTrucks"][truck_id] = future_list[i].result()
+    # get real distance between truck and load, one batched request per load
+    truck_ids = list(loads[load_id]["potentialTrucks"].keys())
+    with stats.timer("distance"):
+        distances = await truck_distances(truck_ids, (payload['originLatitude'], payload["originLongitude"]))
+    if load_id not in loads:
+        # the day ended while distances were being fetched
+        return
+    for truck_id, distance in zip(truck_ids, distances):
+        loads[load_id]["potentialTrucks"][truck_id] = distance
     notify_truck(load_id)
-    end_time = time.time()  # end timer
-    elapsed_time = end_time - start_time
-    #print("end init_load in " + str(elapsed_time) + " seconds for " + str(len(loads[load_id]["potentialTrucks"])) + " trucks")
+
+async def truck_distances(truck_ids, destination):
+    rows = truck_table.rows(truck_ids)
+    origins = list(zip(truck_table.column("positionLatitude")[rows].tolist(), truck_table.column("positionLongitude")[rows].tolist()))
+    return await distance_provider.distances(origins, destination)
+
+async def assign_loads(load_ids):
+    """Batch mode: matches a window of loads at once. One truck x load score
+    matrix, then each truck is offered at most one load of the batch."""
+    load_ids = [load_id for load_id in dict.fromkeys(load_ids) if load_id in loads]
+    candidates = {}
+    with stats.timer("candidate_search"):
+        for load_id in load_ids:
+            load = load_table.record(load_id)
+            nearest = truck_index.nearest(load["equipmentType"], load["originLatitude"], load["originLongitude"], 20)
+            candidates[load_id] = [truck_id for distance, truck_id in nearest if not in_cooldown(truck_id)]
+    with stats.timer("distance"):
+        distances = await asyncio.gather(*(truck_distances(candidates[load_id], (load_table.get(load_id, "originLatitude"), load_table.get(load_id, "originLongitude"))) for load_id in load_ids))
+    # drop whatever expired or got an offer elsewhere while distances were being fetched
+    distances = {load_id: dict(zip(candidates[load_id], load_distances)) for load_id, load_distances in zip(load_ids, distances) if load_id in loads}
+    load_ids = list(distances)
+    truck_ids = ready_trucks([truck_id for truck_id in dict.fromkeys(truck_id for load_id in load_ids for truck_id in candidates[load_id]) if truck_id in trucks])
+    if len(load_ids) == 0 or len(truck_ids) == 0:
+        return
+    column = {truck_id: i for i, truck_id in enumerate(truck_ids)}
+    matrix = np.full((len(truck_ids), len(load_ids)), np.nan)
+    for j, load_id in enumerate(load_ids):
+        for truck_id, distance in distances[load_id].items():
+            if truck_id in column:
+                matrix[column[truck_id], j] = distance
+                loads[load_id]["potentialTrucks"][truck_id] = distance
+    with stats.timer("scoring"):
+        scores, profits = score_matrix(load_table, load_table.rows(load_ids), truck_table, truck_table.rows(truck_ids), latestEventTime, matrix, load_clusters)
+    with stats.timer("assignment"):
+        pairs = ASSIGNERS[LOAD_BATCH_ASSIGNMENT](scores, LOAD_BATCH_OFFERS)
+    # notify per load in score order, all redis writes for the batch go out in one round trip
+    pairs.sort(key=lambda pair: (pair[1], -scores[pair]))
+    claimed = set(claim_trucks([truck_ids[i] for i, j in pairs]))
+    pairs = [(i, j) for i, j in pairs if truck_ids[i] in claimed]
+    pipe = store.pipeline()
+    for i, j in pairs:
+        send_notification(truck_ids[i], load_ids[j], {"profit": float(profits[i, j]), "score": float(scores[i, j])}, pipe)
+    with stats.timer("redis_write"):
+        pipe.execute()
+    stats.incr("notifications_total", len(pairs), mode="batch")
+    if REMOVE_NOTIFIED_LOADS:
+        for load_id in dict.fromkeys(load_ids[j] for i, j in pairs):
+            loads.remove(load_id, "notified")
+
+load_window = LoadWindow(assign_loads, window=LOAD_BATCH_WINDOW_MS / 1000, max_loads=LOAD_BATCH_MAX_LOADS) if LOAD_BATCH_WINDOW_MS > 0 else None
 
 def notify_truck(load_id):
     scores = {}
-    load = loads[load_id]
-    truck_ids = load["potentialTrucks"].keys()
-    # calculate score for each truck
-    for truck_id in truck_ids:
-        distance = load["potentialTrucks"][truck_id]
-        scores[truck_id] = get_score(load, trucks[truck_id], loads, latestTimestamp, distance)
+    potential_trucks = loads[load_id]["potentialTrucks"]
+    load = load_table.record(load_id)
+    # skip candidates that were evicted, or offered another load, while distances were being fetched
+    truck_ids = ready_trucks([truck_id for truck_id in potential_trucks if truck_id in trucks])
+    # calculate score for all trucks at once, straight from the truck columns
+    distances = [potential_trucks[truck_id] for truck_id in truck_ids]
+    with stats.timer("scoring"):
+        batch_scores, batch_profits = score_rows(load, truck_table, truck_table.rows(truck_ids), load_table, latestEventTime, distances, load_clusters)
+    for truck_id, score, profit in zip(truck_ids, batch_scores, batch_profits):
+        scores[truck_id] = {"profit": float(profit), "score": float(score)}
     # sort trucks by score
     truck_ids = sorted(truck_ids, key=lambda x: scores[x]["score"], reverse=True)
-    # notify scores > 0
+    # notify the best 21 with scores > 0, all redis writes for this load go out in one round trip
+    winners = claim_trucks([i for i in truck_ids if scores[i]["score"] > 0][:21])
+    pipe = store.pipeline()
     added = 0
-    for i in truck_ids:
-        if added <= 20:
-            #print((datetime.strptime(latestTimestamp, '%Y-%m-%dT%H:%M:%S') - datetime.strptime(trucks[i]["latestNotification"], '%Y-%m-%dT%H:%M:%S')).total_seconds())
-            if scores[i]["score"] > 0:
-                added += 1
-                # check if time without notification is less than 1 hour
-                if (datetime.strptime(latestTimestamp, '%Y-%m-%dT%H:%M:%S') - datetime.strptime(trucks[i]["latestNotification"], '%Y-%m-%dT%H:%M:%S')).total_seconds() < 1800 and not trucks[i]["timestamp"] == trucks[i]["latestNotification"]:
-                    added -= 1
-                    #print("Truck ", i, " notified less than 1 hour ago, skipping")
-                    continue
-                #else:
-                    #print("Notifying truck " + str(i) + " with score " + str(scores[i]["score"]))
-                #print(trucks[i]["latestNotification"], trucks[i]["timestamp"])
-                # add timestamp to scores, 
-                scores[i]["timestamp"] = latestTimestamp
-                # add loadId to scores
-                scores[i]["loadId"] = load_id
-                # add origin and destination to scores
-                scores[i]["originLatitude"] = load["originLatitude"]
-                scores[i]["originLongitude"] = load["originLongitude"]
-                scores[i]["destinationLatitude"] = load["destinationLatitude"]
-                scores[i]["destinationLongitude"] = load["destinationLongitude"]
-                # add distance to scores
-                scores[i]["mileage"] = load["mileage"]
-                # set to current timestamp
-                trucks[i]["latestNotification"] = latestTimestamp
-                if len(trucks[i]["latestLoads"]) >= 5:
-                    trucks[i]["latestLoads"].pop(4)
-                # insert at beginning
-                trucks[i]["latestLoads"].insert(0, scores[i])
-                store.set_data(i, json.dumps(scores[i]))
-                # edit truck metrics
-                metrics_data = store.get_data("truck_metrics_" + str(i))
-                metrics_data = json.loads(metrics_data)
-                metrics_data["latestNotification"] = latestTimestamp
-                if len(metrics_data["latestLoads"]) >= 5:
-                    metrics_data["latestLoads"].pop(0)
-                metrics_data["latestLoads"].insert(0, scores[i])
-                store.set_data("truck_metrics_" + str(i), json.dumps(metrics_data))
-                #print("Truck " + str(i) + " notified with score " + str(scores[i]))
-        else:
-            break
+    for i in winners:
+        added += 1
+        send_notification(i, load_id, scores[i], pipe)
+    with stats.timer("redis_write"):
+        pipe.execute()
+    stats.incr("notifications_total", added, mode="load")
+    if REMOVE_NOTIFIED_LOADS and added > 0:
+        loads.remove(load_id, "notified")
 
 
-def bird_fly_distance(truck_lat, truck_long, load_lat, load_long):
-    # Radius of the Earth in meters
-    R = 6371000 
-
-    # Convert degrees to radians
-    truck_lat, truck_long, load_lat, load_long = map(math.radians, [truck_lat, truck_long, load_lat, load_long])
-
-    # Differences
-    diff_lat = load_lat - truck_lat
-    diff_long = load_long - truck_long
-
-    # Haversine formula
-    a = math.sin(diff_lat/2) ** 2 + math.cos(truck_lat) * math.cos(load_lat) * math.sin(diff_long/2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-    # Distance in meters
-    distance = R * c
-    # convert to miles
-    distance = distance * 0.000621371
-    return distance
-
-def calculate_distance(truck_lat, truck_long, load_lat, load_long):
-    return bird_fly_distance(truck_lat, truck_long, load_lat, load_long)
-    api_key = os.getenv('GOOGLE_API_KEY')
-    url = f'https://maps.googleapis.com/maps/api/distancematrix/json?units=imperial&origins={truck_lat},{truck_long}&destinations={load_lat},{load_long}&key={api_key}'
-    
-    response = requests.get(url)
-    data = json.loads(response.text)
-    if 'rows' in data and 'elements' in data['rows'][0] and 'distance' in data['rows'][0]['elements'][0]:
-        return data['rows'][0]['elements'][0]['distance']['value']/1000
-    else:
-        raise Exception("Error in calculating distance")
+def in_cooldown(truck_id):
+    # trucks that have never been notified have cooldownUntil 0 and are always eligible
+    return truck_table.get(truck_id, "cooldownUntil") > latestEventTime
+
+def claim_trucks(truck_ids):
+    """The trucks this process may notify now. Without shards that is all of
+    them; shard workers also claim the cooldown in redis, so a truck replicated
+    across a border is not offered loads by two workers at once."""
+    if not shared_cooldown or len(truck_ids) == 0:
+        return truck_ids
+    with stats.timer("cooldown_claim"):
+        claimed = store.claim_cooldowns(truck_ids, latestEventTime, latestEventTime + NOTIFY_COOLDOWN_SECONDS)
+    return [truck_id for truck_id, is_claimed in zip(truck_ids, claimed) if is_claimed]
+
+def ready_trucks(truck_ids):
+    """The trucks out of cooldown, checked on the whole candidate list at once."""
+    if len(truck_ids) == 0:
+        return truck_ids
+    ready = truck_table.column("cooldownUntil")[truck_table.rows(truck_ids)] <= latestEventTime
+    return [truck_id for truck_id, is_ready in zip(truck_ids, ready) if is_ready]
+
+def send_notification(truck_id, load_id, data, pipe):
+    load = load_table.record(load_id)
+    truck = trucks[truck_id]
+    # add timestamp to scores, 
+    data["timestamp"] = latestTimestamp
+    # add loadId to scores
+    data["loadId"] = load_id
+    # add origin and destination to scores
+    data["originLatitude"] = load["originLatitude"]
+    data["originLongitude"] = load["originLongitude"]
+    data["destinationLatitude"] = load["destinationLatitude"]
+    data["destinationLongitude"] = load["destinationLongitude"]
+    # add distance to scores
+    data["mileage"] = load["mileage"]
+    data["price"] = load["price"]
+    # set to current timestamp
+    truck_table.update(truck_id, latestNotification=latestEventTime, cooldownUntil=latestEventTime + NOTIFY_COOLDOWN_SECONDS)
+    if len(truck["latestLoads"]) >= 5:
+        truck["latestLoads"].pop(4)
+    # insert at beginning
+    truck["latestLoads"].insert(0, data)
+    loads[load_id]["offeredTo"].add(truck_id)
+    store.publish_event(truck_id, json.dumps(data), pipe)
+    # edit truck metrics
+    store.set_truck(truck_id, {"latestNotification": latestTimestamp}, pipe)
+    store.push_latest_load(truck_id, data, pipe)
+    # this month's offer counters, served by /metrics
+    store.record_offer(truck_id, month_of(latestEventTime), load["mileage"], load["price"], pipe)
+
+async def match_truck(truck_id):
+    """Offers a truck that just moved the best open load near it, if any."""
+    if in_cooldown(truck_id):
+        return
+    position = (truck_table.get(truck_id, "positionLatitude"), truck_table.get(truck_id, "positionLongitude"))
+    with stats.timer("reverse_search"):
+        nearest = load_index.nearest(truck_table.get(truck_id, "equipType"), position[0], position[1], REVERSE_MATCH_LOADS)
+    load_ids = [load_id for distance, load_id in nearest if distance <= REVERSE_MATCH_MILES and truck_id not in loads[load_id]["offeredTo"]]
+    if len(load_ids) == 0:
+        return
+    # one request from the truck to every candidate load
+    with stats.timer("distance"):
+        distances = await distance_provider.distances_from(position, [(load_table.get(load_id, "originLatitude"), load_table.get(load_id, "originLongitude")) for load_id in load_ids])
+    if truck_id not in trucks:
+        return
+    best = None
+    with stats.timer("scoring"):
+        for load_id, distance in zip(load_ids, distances):
+            if load_id not in loads:
+                continue
+            scores, profits = score_rows(load_table.record(load_id), truck_table, truck_table.rows([truck_id]), load_table, latestEventTime, [distance], load_clusters)
+            if scores[0] > 0 and (best is None or scores[0] > best[0]):
+                best = (float(scores[0]), float(profits[0]), load_id, distance)
+    if best is None:
+        return
+    score, profit, load_id, distance = best
+    if not claim_trucks([truck_id]):
+        return
+    loads[load_id]["potentialTrucks"][truck_id] = distance
+    pipe = store.pipeline()
+    send_notification(truck_id, load_id, {"profit": profit, "score": score}, pipe)
+    with stats.timer("redis_write"):
+        pipe.execute()
+    stats.incr("notifications_total", 1, mode="reverse")
+    if REMOVE_NOTIFIED_LOADS:
+        loads.remove(load_id, "notified")
+
+def snapshot_state():
+    """Everything needed to resume matching, as flat arrays (see snapshot.py)."""
+    truck_ids = list(trucks.keys())
+    load_ids = list(loads.keys())
+    offered = [(load_id, truck_id) for load_id in load_ids for truck_id in loads[load_id]["offeredTo"]]
+    arrays = {"clock.eventTime": np.array([latestEventTime]), "clock.timestamp": np.array([latestTimestamp])}
+    arrays.update(prefixed("truckTable", truck_table.export()))
+    arrays.update(prefixed("loadTable", load_table.export()))
+    # registry order is the eviction order, keep it
+    arrays["trucks.ids"] = np.asarray(truck_ids)
+    arrays["trucks.seenAt"] = np.array([trucks.seen_at[truck_id] for truck_id in truck_ids], dtype=np.float64)
+    arrays["trucks.seq"] = np.array([trucks[truck_id]["seq"] for truck_id in truck_ids], dtype=np.int64)
+    arrays["trucks.timestamp"] = np.array([trucks[truck_id]["timestamp"] for truck_id in truck_ids], dtype=str)
+    arrays["trucks.latestLoads"] = np.array([json.dumps(trucks[truck_id]["latestLoads"]) for truck_id in truck_ids], dtype=str)
+    arrays["loads.ids"] = np.asarray(load_ids)
+    arrays["loads.seenAt"] = np.array([loads.seen_at[load_id] for load_id in load_ids], dtype=np.float64)
+    arrays["loads.seq"] = np.array([loads[load_id]["seq"] for load_id in load_ids], dtype=np.int64)
+    arrays["loads.timestamp"] = np.array([loads[load_id]["timestamp"] for load_id in load_ids], dtype=str)
+    arrays["offeredTo.loads"] = np.asarray([load_id for load_id, truck_id in offered])
+    arrays["offeredTo.trucks"] = np.asarray([truck_id for load_id, truck_id in offered])
+    if load_clusters.centroids is not None:
+        arrays["clusters.centroids"] = load_clusters.centroids
+    return arrays
+
+def restore_state(arrays):
+    """Replaces the in-memory state with a snapshot_state() result; redis is left alone."""
+    global latestTimestamp, latestEventTime
+    end_day(clear_redis=False)
+    truck_table.restore(unprefixed("truckTable", arrays))
+    load_table.restore(unprefixed("loadTable", arrays))
+    for truck_id, seen_at, seq, timestamp, latest_loads in zip(arrays["trucks.ids"].tolist(), arrays["trucks.seenAt"].tolist(), arrays["trucks.seq"].tolist(), arrays["trucks.timestamp"].tolist(), arrays["trucks.latestLoads"].tolist()):
+        trucks.put(truck_id, {"seq": seq, "timestamp": timestamp, "latestLoads": json.loads(latest_loads)}, seen_at)
+        truck_index.add(truck_id, truck_table.get(truck_id, "equipType"), truck_table.get(truck_id, "positionLatitude"), truck_table.get(truck_id, "positionLongitude"))
+    for load_id, seen_at, seq, timestamp in zip(arrays["loads.ids"].tolist(), arrays["loads.seenAt"].tolist(), arrays["loads.seq"].tolist(), arrays["loads.timestamp"].tolist()):
+        loads.put(load_id, {"seq": seq, "timestamp": timestamp, "potentialTrucks": {}, "offeredTo": set()}, seen_at)
+        load_index.add(load_id, load_table.get(load_id, "equipmentType"), load_table.get(load_id, "originLatitude"), load_table.get(load_id, "originLongitude"))
+    for load_id, truck_id in zip(arrays["offeredTo.loads"].tolist(), arrays["offeredTo.trucks"].tolist()):
+        if load_id in loads:
+            loads[load_id]["offeredTo"].add(truck_id)
+    if "clusters.centroids" in arrays:
+        load_clusters.centroids = arrays["clusters.centroids"]
+    latestEventTime = float(arrays["clock.eventTime"][0])
+    latestTimestamp = str(arrays["clock.timestamp"][0])
+
+def save_snapshot(path):
+    with stats.timer("snapshot"):
+        write_snapshot(path, snapshot_state())
+
+def restore_snapshot(path):
+    """Loads the snapshot at path if there is a recent one; returns whether it did."""
+    arrays = read_snapshot(path, MAX_AGE)
+    if arrays is None:
+        return False
+    restore_state(arrays)
+    logging.info("Restored %d trucks and %d loads from %s", len(trucks), len(loads), path)
+    return True
+
+def registry_stats():
+    return {"trucks": trucks.stats(), "loads": loads.stats()}
+
+stats.add_gauges(lambda: {"ingest": ingest.stats()})
+stats.add_gauges(registry_stats)
+if load_window is not None:
+    stats.add_gauges(lambda: {"load_window": load_window.stats()})
 
 
 STOP = asyncio.Event()
@@ -201,12 +453,17 @@ async def main():
 
     client.set_auth_credentials("CodeJamUser", "123CodeJam")
 
+    ingest.start()
     await client.connect("fortuitous-welder.cloudmqtt.com", 1883, False, 60)
 
     while not STOP.is_set():
         await asyncio.sleep(1)
 
     await client.disconnect()
+    await ingest.stop()
+    if load_window is not None:
+        await load_window.flush()
+    await distance_provider.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+#############################
+#   BATCHED LOAD MATCHING   #
+#############################
+
+def assign_greedy(scores, per_load):
+    """Best pairs first: each truck gets at most one load, each load at most
+    per_load trucks. Only pairs with a positive score are offered.
+
+    Returns [(truck index, load index)] into the (trucks, loads) score matrix.
+    """
+    truck_idx, load_idx = np.nonzero(scores > 0)
+    order = np.argsort(-scores[truck_idx, load_idx], kind="stable")
+    taken = set()
+    offers = np.zeros(scores.shape[1], dtype=np.int64)
+    pairs = []
+    for i in order:
+        truck, load = truck_idx[i], load_idx[i]
+        if truck in taken or offers[load] >= per_load:
+            continue
+        taken.add(truck)
+        offers[load] += 1
+        pairs.append((int(truck), int(load)))
+    return pairs
+
+def assign_hungarian(scores, per_load):
+    """Same constraints as assign_greedy, but maximizes the total score of the
+    batch: every load column is repeated per_load times and the resulting
+    rectangular assignment problem is solved exactly."""
+    active = np.flatnonzero((scores > 0).any(axis=1))
+    if len(active) == 0:
+        return []
+    per_load = min(per_load, len(active))
+    gains = np.where(scores[active] > 0, scores[active], 0.0)
+    rows, columns = linear_sum_assignment(np.repeat(gains, per_load, axis=1), maximize=True)
+    load_idx = columns // per_load
+    keep = gains[rows, load_idx] > 0
+    return list(zip(active[rows[keep]].tolist(), load_idx[keep].tolist()))
+
+ASSIGNERS = {"hungarian": assign_hungarian, "greedy": assign_greedy}
+
+
+class LoadWindow:
+    """Collects load ids for up to `window` seconds or `max_loads` loads,
+    whichever comes first, then hands the batch to `handler` in one call.
+
+    A full window is matched by the caller of add(), an expired one by a timer
+    task; flush() matches whatever is pending right away (end of day, shutdown).
+    """
+    def __init__(self, handler, window=0.2, max_loads=50):
+        self.handler = handler
+        self.window = window
+        self.max_loads = max_loads
+        self.pending = []
+        self.timer = None
+        self.batches = 0
+        self.batched_loads = 0
+
+    async def add(self, load_id):
+        self.pending.append(load_id)
+        if len(self.pending) >= self.max_loads:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self.expire())
+
+    async def expire(self):
+        await asyncio.sleep(self.window)
+        self.timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logging.exception("Failed to match a batch of loads")
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if len(batch) == 0:
+            return
+        self.batches += 1
+        self.batched_loads += len(batch)
+        await self.handler(batch)
+
+    def stats(self):
+        return {"pending": len(self.pending), "batches": self.batches, "batched_loads": self.batched_loads}
@@ -0,0 +1,112 @@
+"""
+Offers for a burst of loads: per-load greedy (notify_truck) vs batched
+assignment (greedy and Hungarian) on one truck x load score matrix.
+
+Trucks are packed into a few hot spots so nearby loads compete for the same
+candidates. Reports the total score offered, how many distinct trucks got an
+offer, how many loads got none, and the time spent scoring and assigning.
+
+Run from the backend folder:
+    python benchmarks/bench_assignment.py
+"""
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assignment import assign_greedy, assign_hungarian
+from columnar import ColumnStore
+from geo import METERS_TO_MILES, distance_matrix
+from heuristic import LoadClusters, score_matrix, score_rows
+
+N_TRUCKS = 2000
+BATCH_SIZES = [10, 50, 200]
+CANDIDATES = 20
+OFFERS = 20
+HOT_SPOTS = [(41.88, -87.63), (33.75, -84.39), (32.78, -96.80), (34.05, -118.24)]
+NOW = 1700236800.0
+
+
+def near_hot_spot():
+    lat, long = random.choice(HOT_SPOTS)
+    return lat + random.gauss(0, 0.5), long + random.gauss(0, 0.5)
+
+
+def build_tables(n_loads):
+    trucks = ColumnStore({"positionLatitude": np.float64, "positionLongitude": np.float64, "nextTripLengthPreference": np.int8, "latestNotification": np.float64}, categorical=("nextTripLengthPreference",))
+    for truck_id in range(N_TRUCKS):
+        lat, long = near_hot_spot()
+        trucks.insert(truck_id, positionLatitude=lat, positionLongitude=long, nextTripLengthPreference=random.choice(["Long", "Short"]),
+                      latestNotification=NOW - random.uniform(0, 6 * 3600))
+    loads = ColumnStore({"originLatitude": np.float64, "originLongitude": np.float64, "destinationLatitude": np.float64, "destinationLongitude": np.float64, "price": np.float64, "mileage": np.float64})
+    for load_id in range(n_loads):
+        lat, long = near_hot_spot()
+        destination_lat, destination_long = near_hot_spot()
+        mileage = random.uniform(50, 2500)
+        loads.insert(load_id, originLatitude=lat, originLongitude=long, destinationLatitude=destination_lat, destinationLongitude=destination_long,
+                     price=mileage * random.uniform(1.5, 3.5), mileage=mileage)
+    return trucks, loads
+
+
+def candidate_distances(trucks, loads):
+    """(trucks, loads) road-ish miles for the CANDIDATES nearest trucks of each load, NaN elsewhere."""
+    truck_rows, load_rows = trucks.live_rows(), loads.live_rows()
+    miles = distance_matrix(trucks.column("positionLatitude")[truck_rows], trucks.column("positionLongitude")[truck_rows],
+                            loads.column("originLatitude")[load_rows], loads.column("originLongitude")[load_rows]) * METERS_TO_MILES * 1.25
+    nearest = np.argpartition(miles, CANDIDATES, axis=0)[:CANDIDATES]
+    distances = np.full(miles.shape, np.nan)
+    columns = np.broadcast_to(np.arange(miles.shape[1]), nearest.shape)
+    distances[nearest, columns] = miles[nearest, columns]
+    return distances
+
+
+def per_load(trucks, loads, distances, clusters):
+    """What notify_truck does: each load in turn offers its best trucks that are not cooling down."""
+    cooling = set()
+    pairs = []
+    for j in loads.live_rows():
+        candidates = [int(i) for i in np.flatnonzero(~np.isnan(distances[:, j])) if i not in cooling]
+        scores, _ = score_rows(loads.record(j), trucks, np.array(candidates, dtype=np.intp), loads, NOW, distances[candidates, j], clusters)
+        ranked = sorted(zip(scores, candidates), reverse=True)
+        for score, i in ranked[:OFFERS]:
+            if score > 0:
+                cooling.add(i)
+                pairs.append((i, int(j)))
+    return pairs
+
+
+def report(label, pairs, scores, n_loads, elapsed):
+    total = sum(scores[i, j] for i, j in pairs)
+    offered_loads = len({j for i, j in pairs})
+    print(f"    {label:<10} score {total:9.1f}  offers {len(pairs):5}  trucks {len({i for i, j in pairs}):5}  "
+          f"loads without offer {n_loads - offered_loads:4}  {elapsed * 1000:8.1f} ms")
+
+
+def run(n_loads):
+    trucks, loads = build_tables(n_loads)
+    distances = candidate_distances(trucks, loads)
+    print(f"{n_loads} loads, {N_TRUCKS} trucks")
+    # fit the load clusters once, outside the timings
+    clusters = LoadClusters()
+    clusters.get_centroids(loads)
+    start = time.perf_counter()
+    scores, _ = score_matrix(loads, loads.live_rows(), trucks, trucks.live_rows(), NOW, distances, clusters)
+    matrix_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pairs = per_load(trucks, loads, distances, clusters)
+    report("per-load", pairs, scores, n_loads, time.perf_counter() - start)
+    for label, assign in (("greedy", assign_greedy), ("hungarian", assign_hungarian)):
+        start = time.perf_counter()
+        pairs = assign(scores, OFFERS)
+        report(label, pairs, scores, n_loads, matrix_time + time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    random.seed(13)
+    for n_loads in BATCH_SIZES:
+        run(n_loads)
@@ -0,0 +1,83 @@
+"""
+Per-load candidate search latency: linear heap scan vs FleetIndex, on a
+static fleet and with position updates streaming in between the loads.
+
+Run from the backend folder:
+    python benchmarks/bench_candidate_search.py
+"""
+import heapq
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import bird_fly_distance
+from spatial_index import FleetIndex
+
+EQUIP_TYPES = ["Van", "Flatbed", "Reefer"]
+FLEET_SIZES = [1000, 10000, 50000]
+N_LOADS = 200
+MOVES_PER_LOAD = 60
+
+
+def random_position():
+    # continental US bounding box
+    return random.uniform(25.0, 49.0), random.uniform(-124.0, -67.0)
+
+
+def linear_nearest(trucks, equip_type, lat, long, k):
+    dists = []
+    for truck_id, truck in trucks.items():
+        if truck["equipType"] != equip_type:
+            continue
+        distance = bird_fly_distance(truck["positionLatitude"], truck["positionLongitude"], lat, long)
+        heapq.heappush(dists, (distance, truck_id))
+    return [heapq.heappop(dists) for _ in range(min(k, len(dists)))]
+
+
+def run(n_trucks):
+    trucks = {}
+    index = FleetIndex()
+    for truck_id in range(n_trucks):
+        lat, long = random_position()
+        equip_type = random.choice(EQUIP_TYPES)
+        trucks[truck_id] = {"positionLatitude": lat, "positionLongitude": long, "equipType": equip_type}
+        index.add(truck_id, equip_type, lat, long)
+    queries = [(random.choice(EQUIP_TYPES),) + random_position() for _ in range(N_LOADS)]
+
+    start = time.perf_counter()
+    expected = [linear_nearest(trucks, *query, 20) for query in queries]
+    linear_ms = (time.perf_counter() - start) * 1000 / N_LOADS
+
+    start = time.perf_counter()
+    actual = [index.nearest(*query, 20) for query in queries]
+    index_ms = (time.perf_counter() - start) * 1000 / N_LOADS
+
+    matches = sum(1 for a, b in zip(expected, actual) if [t for _, t in a] == [t for _, t in b])
+    print(f"{n_trucks:>7} trucks | linear {linear_ms:8.3f} ms/load | index {index_ms:8.3f} ms/load | "
+          f"speedup {linear_ms / index_ms:6.1f}x | top-20 identical {matches}/{N_LOADS}")
+
+    # trucks keep reporting new positions between loads; lookups must stay sub-linear
+    index_time = 0.0
+    matches = 0
+    for query in queries:
+        for _ in range(MOVES_PER_LOAD):
+            truck_id = random.randrange(n_trucks)
+            lat, long = random_position()
+            trucks[truck_id]["positionLatitude"], trucks[truck_id]["positionLongitude"] = lat, long
+            start = time.perf_counter()
+            index.add(truck_id, trucks[truck_id]["equipType"], lat, long)
+            index_time += time.perf_counter() - start
+        start = time.perf_counter()
+        actual = index.nearest(*query, 20)
+        index_time += time.perf_counter() - start
+        matches += [t for _, t in actual] == [t for _, t in linear_nearest(trucks, *query, 20)]
+    print(f"{'':>7} moving | index incl. updates {index_time * 1000 / N_LOADS:8.3f} ms/load | top-20 identical {matches}/{N_LOADS}")
+
+
+if __name__ == "__main__":
+    random.seed(13)
+    for n_trucks in FLEET_SIZES:
+        run(n_trucks)
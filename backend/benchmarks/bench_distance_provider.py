@@ -0,0 +1,73 @@
+"""
+Road distance lookups against the local Distance Matrix stub.
+
+Starts distance_stub on a free port, then measures per-load latency for
+20 origins -> 1 destination with a cold and a warm cache, and checks that a
+slow server falls back to haversine within the timeout.
+
+Run from the backend folder:
+    python benchmarks/bench_distance_provider.py
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from distance_provider import DistanceMatrixProvider, HaversineProvider
+from distance_stub import make_app
+
+N_LOADS = 200
+N_ORIGINS = 20
+
+
+async def start_stub(delay):
+    runner = web.AppRunner(make_app(delay))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/maps/api/distancematrix/json"
+
+
+def random_point():
+    return random.uniform(25.0, 49.0), random.uniform(-124.0, -67.0)
+
+
+async def time_loads(provider, events):
+    start = time.perf_counter()
+    results = [await provider.distances(origins, destination) for origins, destination in events]
+    return (time.perf_counter() - start) * 1000 / len(events), results
+
+
+async def main():
+    random.seed(13)
+    events = [([random_point() for _ in range(N_ORIGINS)], random_point()) for _ in range(N_LOADS)]
+
+    runner, url = await start_stub(delay=0.0)
+    provider = DistanceMatrixProvider("stub", url=url)
+    cold_ms, road = await time_loads(provider, events)
+    warm_ms, _ = await time_loads(provider, events)
+    print(f"stub   cold cache {cold_ms:7.3f} ms/load | warm cache {warm_ms:7.3f} ms/load | "
+          f"requests {provider.requests} for {2 * N_LOADS} loads | fallbacks {provider.fallbacks}")
+    await provider.close()
+    await runner.cleanup()
+
+    _, straight = await time_loads(HaversineProvider(), events)
+    ratio = sum(r / s for rs, ss in zip(road, straight) for r, s in zip(rs, ss)) / (N_LOADS * N_ORIGINS)
+    print(f"stub   road/straight-line ratio {ratio:.3f}")
+
+    runner, url = await start_stub(delay=1.0)
+    provider = DistanceMatrixProvider("stub", url=url, timeout=0.1)
+    slow_ms, _ = await time_loads(provider, events[:10])
+    print(f"slow   timeout 100 ms -> {slow_ms:7.3f} ms/load | fallbacks {provider.fallbacks}/{10 * N_ORIGINS}")
+    await provider.close()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,56 @@
+"""
+Scalar bird_fly_distance in a Python loop vs the broadcasting geo.haversine.
+
+Run from the backend folder:
+    python benchmarks/bench_haversine.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import bird_fly_distance, distances_to, distance_matrix
+
+SIZES = [1000, 10000, 100000]
+N_CENTROIDS = 50
+
+
+def best_of(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000, result
+
+
+def run(n_points, rng):
+    lats = rng.uniform(25.0, 49.0, n_points)
+    longs = rng.uniform(-124.0, -67.0, n_points)
+    c_lats = rng.uniform(25.0, 49.0, N_CENTROIDS)
+    c_longs = rng.uniform(-124.0, -67.0, N_CENTROIDS)
+    lat, long = 39.5, -87.4
+
+    lat_list, long_list = lats.tolist(), longs.tolist()
+    scalar_ms, expected = best_of(lambda: [bird_fly_distance(a, b, lat, long) for a, b in zip(lat_list, long_list)])
+    vector_ms, actual = best_of(lambda: distances_to(lats, longs, lat, long))
+    diff = np.max(np.abs(np.array(expected) - actual))
+    print(f"one-to-many  {n_points:>7} points | scalar {scalar_ms:9.2f} ms | numpy {vector_ms:7.2f} ms | "
+          f"speedup {scalar_ms / vector_ms:6.1f}x | max |diff| {diff:.1e} mi")
+
+    c_lat_list, c_long_list = c_lats.tolist(), c_longs.tolist()
+    scalar_ms, expected = best_of(lambda: [[bird_fly_distance(a, b, c, d) for c, d in zip(c_lat_list, c_long_list)]
+                                           for a, b in zip(lat_list, long_list)], repeat=1)
+    vector_ms, actual = best_of(lambda: distance_matrix(lats, longs, c_lats, c_longs))
+    diff = np.max(np.abs(np.array(expected) - actual))
+    print(f"many-to-many {n_points:>7}x{N_CENTROIDS} | scalar {scalar_ms:9.2f} ms | numpy {vector_ms:7.2f} ms | "
+          f"speedup {scalar_ms / vector_ms:6.1f}x | max |diff| {diff:.1e} mi")
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(13)
+    for n_points in SIZES:
+        run(n_points, rng)
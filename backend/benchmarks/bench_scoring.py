@@ -0,0 +1,67 @@
+"""
+Per-load scoring latency: get_score per candidate vs score_batch.
+Also checks that both produce the same scores.
+
+Run from the backend folder:
+    python benchmarks/bench_scoring.py
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heuristic import get_score, score_batch, LoadClusters
+
+CANDIDATES = [20, 200, 2000]
+N_LOADS = 50
+N_OPEN_LOADS = 500
+START = datetime(2023, 11, 17, 8, 0, 0)
+
+
+def random_timestamp():
+    return (START + timedelta(seconds=random.randint(0, 12 * 3600))).isoformat()
+
+
+def random_load():
+    return {"originLatitude": random.uniform(25.0, 49.0), "originLongitude": random.uniform(-124.0, -67.0),
+            "destinationLatitude": random.uniform(25.0, 49.0), "destinationLongitude": random.uniform(-124.0, -67.0),
+            "price": random.uniform(500, 5000), "mileage": random.uniform(50, 2500)}
+
+
+def random_truck():
+    return {"positionLatitude": random.uniform(25.0, 49.0), "positionLongitude": random.uniform(-124.0, -67.0),
+            "nextTripLengthPreference": random.choice(["Long", "Short"]), "latestNotification": random_timestamp()}
+
+
+def run(n_candidates):
+    loads = {load_id: random_load() for load_id in range(N_OPEN_LOADS)}
+    clusters = LoadClusters()
+    timestamp = (START + timedelta(hours=13)).isoformat()
+    events = []
+    for _ in range(N_LOADS):
+        load = random.choice(list(loads.values()))
+        candidates = [random_truck() for _ in range(n_candidates)]
+        distances = [random.uniform(0, 500) for _ in range(n_candidates)]
+        events.append((load, candidates, distances))
+
+    start = time.perf_counter()
+    expected = [[get_score(load, truck, loads, timestamp, distance, clusters)["score"] for truck, distance in zip(candidates, distances)]
+                for load, candidates, distances in events]
+    per_pair_ms = (time.perf_counter() - start) * 1000 / N_LOADS
+
+    start = time.perf_counter()
+    actual = [score_batch(load, candidates, loads, timestamp, distances, clusters)[0] for load, candidates, distances in events]
+    batch_ms = (time.perf_counter() - start) * 1000 / N_LOADS
+
+    max_diff = max(abs(a - b) for e, s in zip(expected, actual) for a, b in zip(e, s))
+    print(f"{n_candidates:>5} candidates | get_score {per_pair_ms:8.3f} ms/load | score_batch {batch_ms:8.3f} ms/load | "
+          f"speedup {per_pair_ms / batch_ms:6.1f}x | max |diff| {max_diff:.2e}")
+
+
+if __name__ == "__main__":
+    random.seed(13)
+    for n_candidates in CANDIDATES:
+        run(n_candidates)
@@ -0,0 +1,83 @@
+"""
+Memory held by matcher state: truck/load dicts vs ColumnStore columns.
+
+Builds the same synthetic fleet both ways and reports the traced allocation
+size per fleet size (ids and the registries' bookkeeping are left out on both
+sides).
+
+Run from the backend folder:
+    python benchmarks/bench_state_memory.py
+"""
+import os
+import random
+import sys
+import tracemalloc
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import ColumnStore
+
+FLEET_SIZES = [1000, 10000, 100000]
+LOADS_PER_TRUCK = 0.5
+START = datetime(2023, 11, 17, 8, 0, 0)
+EQUIP_TYPES = ["Van", "Reefer", "Flatbed"]
+
+
+def random_timestamp():
+    return (START + timedelta(seconds=random.randint(0, 12 * 3600))).isoformat()
+
+
+def random_truck():
+    return {"positionLatitude": random.uniform(25.0, 49.0), "positionLongitude": random.uniform(-124.0, -67.0),
+            "equipType": random.choice(EQUIP_TYPES), "nextTripLengthPreference": random.choice(["Long", "Short"]),
+            "latestNotification": random_timestamp()}
+
+
+def random_load():
+    return {"originLatitude": random.uniform(25.0, 49.0), "originLongitude": random.uniform(-124.0, -67.0),
+            "destinationLatitude": random.uniform(25.0, 49.0), "destinationLongitude": random.uniform(-124.0, -67.0),
+            "equipmentType": random.choice(EQUIP_TYPES), "price": random.uniform(500, 5000), "mileage": random.uniform(50, 2500)}
+
+
+def as_dicts(truck_rows, load_rows):
+    trucks = {truck_id: dict(truck) for truck_id, truck in truck_rows}
+    loads = {load_id: dict(load) for load_id, load in load_rows}
+    return trucks, loads
+
+
+def as_columns(truck_rows, load_rows):
+    trucks = ColumnStore({"positionLatitude": np.float64, "positionLongitude": np.float64, "equipType": np.int16, "nextTripLengthPreference": np.int8, "latestNotification": np.float64}, categorical=("equipType", "nextTripLengthPreference"))
+    loads = ColumnStore({"originLatitude": np.float64, "originLongitude": np.float64, "destinationLatitude": np.float64, "destinationLongitude": np.float64, "price": np.float64, "mileage": np.float64, "equipmentType": np.int16}, categorical=("equipmentType",))
+    for truck_id, truck in truck_rows:
+        trucks.insert(truck_id, **dict(truck, latestNotification=datetime.fromisoformat(truck["latestNotification"]).timestamp()))
+    for load_id, load in load_rows:
+        loads.insert(load_id, **load)
+    return trucks, loads
+
+
+def traced(build, *args):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = build(*args)
+    size = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return size, state
+
+
+def run(n_trucks):
+    # ids and field values are created up front so only the containers are traced
+    truck_rows = [(truck_id, random_truck()) for truck_id in range(n_trucks)]
+    load_rows = [(load_id, random_load()) for load_id in range(int(n_trucks * LOADS_PER_TRUCK))]
+    dict_size, _ = traced(as_dicts, truck_rows, load_rows)
+    column_size, _ = traced(as_columns, truck_rows, load_rows)
+    print(f"{n_trucks:>7} trucks  dicts {dict_size / 2**20:8.2f} MiB  columns {column_size / 2**20:8.2f} MiB  "
+          f"({dict_size / column_size:4.1f}x smaller)")
+
+
+if __name__ == "__main__":
+    random.seed(13)
+    for n_trucks in FLEET_SIZES:
+        run(n_trucks)
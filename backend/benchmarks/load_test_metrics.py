@@ -0,0 +1,76 @@
+"""
+Concurrency load test for GET /metrics/{truck_id}.
+
+Seeds a few trucks in Redis, then fires requests at a running API with an
+increasing number of concurrent clients and reports p50/p99 latency.
+
+Run from the backend folder against a running server:
+    uvicorn main:app --port 8000 &
+    python benchmarks/load_test_metrics.py --url http://localhost:8000 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from redis_store import store, month_of
+
+CONCURRENCY = [1, 10, 50, 200]
+N_TRUCKS = 100
+
+
+def seed():
+    pipe = store.pipeline()
+    for truck_id in range(N_TRUCKS):
+        store.set_truck(truck_id, {"positionLatitude": 40.0, "positionLongitude": -80.0, "equipType": "Van",
+                                   "nextTripLengthPreference": "Long", "latestNotification": "2023-11-17T08:00:00"}, pipe)
+        store.record_offer(truck_id, month_of(time.time()), 480.0, 1000.0, pipe)
+    pipe.execute()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+async def run(url, concurrency, n_requests):
+    latencies = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def client(session):
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            async with session.get(f"{url}/metrics/{i % N_TRUCKS}") as response:
+                await response.read()
+                if response.status != 200:
+                    errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    print(f"concurrency {concurrency:>4} | {n_requests / elapsed:8.1f} req/s | p50 {percentile(latencies, 50):7.2f} ms | "
+          f"p99 {percentile(latencies, 99):7.2f} ms | errors {errors}")
+
+
+async def main(args):
+    for concurrency in CONCURRENCY:
+        await run(args.url, concurrency, args.requests)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+    seed()
+    asyncio.run(main(args))
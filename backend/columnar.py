@@ -0,0 +1,161 @@
+import numpy as np
+
+#############################
+#   STRUCT-OF-ARRAYS STATE  #
+#############################
+
+class Categories:
+    """Two-way mapping between string labels and small integer codes."""
+    def __init__(self, labels=()):
+        self.codes = {}
+        self.labels = []
+        for label in labels:
+            self.code(label)
+
+    def code(self, label):
+        code = self.codes.get(label)
+        if code is None:
+            code = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return code
+
+    def lookup(self, label):
+        """Code of an existing label, -1 if it was never seen (matches no row)."""
+        return self.codes.get(label, -1)
+
+    def label(self, code):
+        return self.labels[code]
+
+
+class ColumnStore:
+    """One NumPy column per numeric field, rows addressed by id.
+
+    Removed rows go on a free list and are reused by the next insert, so row
+    numbers stay dense. Columns listed in `categorical` take string labels on
+    insert/update and store their codes. Columns are reallocated when the
+    table grows, so read them through column() rather than keeping references
+    across inserts.
+    """
+    def __init__(self, columns, categorical=(), capacity=1024):
+        self.dtypes = dict(columns)
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+        self.categories = {name: Categories() for name in categorical}
+        self.live = np.zeros(capacity, dtype=bool)
+        self.ids = [None] * capacity
+        self.row_of = {}
+        self.free = []
+        self.size = 0
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def __contains__(self, key):
+        return key in self.row_of
+
+    def capacity(self):
+        return len(self.live)
+
+    def grow(self):
+        capacity = self.capacity() * 2
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+        live = np.zeros(capacity, dtype=bool)
+        live[:len(self.live)] = self.live
+        self.live = live
+        self.ids.extend([None] * (capacity - len(self.ids)))
+
+    def insert(self, key, **values):
+        if key in self.row_of:
+            self.update(key, **values)
+            return self.row_of[key]
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == self.capacity():
+                self.grow()
+            row = self.size
+            self.size += 1
+        self.row_of[key] = row
+        self.ids[row] = key
+        self.live[row] = True
+        for column in self.columns.values():
+            column[row] = 0
+        self.set_row(row, values)
+        return row
+
+    def update(self, key, **values):
+        self.set_row(self.row_of[key], values)
+
+    def set_row(self, row, values):
+        for name, value in values.items():
+            if name in self.categories:
+                value = self.categories[name].code(value)
+            self.columns[name][row] = value
+
+    def remove(self, key):
+        row = self.row_of.pop(key, None)
+        if row is None:
+            return
+        self.live[row] = False
+        self.ids[row] = None
+        self.free.append(row)
+
+    def clear(self):
+        self.row_of.clear()
+        self.free.clear()
+        self.live[:] = False
+        self.ids = [None] * self.capacity()
+        self.size = 0
+
+    def row(self, key):
+        return self.row_of[key]
+
+    def rows(self, keys):
+        return np.fromiter((self.row_of[key] for key in keys), dtype=np.intp, count=len(keys))
+
+    def column(self, name):
+        return self.columns[name]
+
+    def get(self, key, name):
+        value = self.columns[name][self.row_of[key]]
+        if name in self.categories:
+            return self.categories[name].label(value)
+        return value.item()
+
+    def record(self, key):
+        """All fields of one row as a plain dict, categorical columns as labels."""
+        return {name: self.get(key, name) for name in self.columns}
+
+    def live_rows(self):
+        return np.flatnonzero(self.live[:self.size])
+
+    def export(self):
+        """The live rows as plain arrays (ids, each column, category labels), for snapshots."""
+        rows = self.live_rows()
+        arrays = {"ids": np.asarray([self.ids[row] for row in rows])}
+        for name, column in self.columns.items():
+            arrays[name] = column[rows]
+        for name, categories in self.categories.items():
+            arrays[name + ".labels"] = np.asarray(categories.labels, dtype=str)
+        return arrays
+
+    def restore(self, arrays):
+        """Replaces the contents with what export() returned, rows packed from 0."""
+        self.clear()
+        for name in self.categories:
+            self.categories[name] = Categories(arrays[name + ".labels"].tolist())
+        ids = arrays["ids"].tolist()
+        while self.capacity() < len(ids):
+            self.grow()
+        n = len(ids)
+        for name, column in self.columns.items():
+            column[:n] = arrays[name] if name in arrays else 0
+        self.live[:n] = True
+        self.ids[:n] = ids
+        self.row_of = {key: row for row, key in enumerate(ids)}
+        self.size = n
+
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values()) + self.live.nbytes
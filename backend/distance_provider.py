@@ -0,0 +1,155 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+import aiohttp
+from geo import distances_to, haversine, METERS_TO_MILES
+
+#############################
+#    ROAD DISTANCE LOOKUP   #
+#############################
+
+class DistanceCache:
+    """LRU cache with a TTL, keyed on (origin, destination) rounded to `precision` decimals."""
+    def __init__(self, max_size=100000, ttl=3600, precision=3):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.precision = precision
+        self.entries = OrderedDict()
+
+    def key(self, origin, destination):
+        return tuple(round(x, self.precision) for x in (*origin, *destination))
+
+    def get(self, origin, destination):
+        key = self.key(origin, destination)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        distance, expires = entry
+        if expires < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return distance
+
+    def put(self, origin, destination, distance):
+        key = self.key(origin, destination)
+        self.entries[key] = (distance, time.monotonic() + self.ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+
+class HaversineProvider:
+    """Straight-line distance in miles, no network."""
+    async def distances(self, origins, destination):
+        if len(origins) == 0:
+            return []
+        lats = [origin[0] for origin in origins]
+        longs = [origin[1] for origin in origins]
+        return distances_to(lats, longs, destination[0], destination[1]).tolist()
+
+    async def distances_from(self, origin, destinations):
+        if len(destinations) == 0:
+            return []
+        lats = [destination[0] for destination in destinations]
+        longs = [destination[1] for destination in destinations]
+        return haversine(origin[0], origin[1], lats, longs).tolist()
+
+    async def close(self):
+        pass
+
+
+class DistanceMatrixProvider:
+    """Road distance in miles from a Google Distance Matrix compatible endpoint.
+
+    All uncached origins of a load go out in one many-origins-to-one-destination
+    request over a shared keep-alive connection pool, and all uncached
+    destinations of a moving truck in one one-origin-to-many request. Pairs the
+    API cannot answer, or the whole batch on timeout, fall back to haversine.
+    """
+    def __init__(self, api_key, url="https://maps.googleapis.com/maps/api/distancematrix/json", timeout=2.0, pool_size=20, cache=None):
+        self.api_key = api_key
+        self.url = url
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.pool_size = pool_size
+        self.cache = cache if cache is not None else DistanceCache()
+        self.fallback = HaversineProvider()
+        self.session = None
+        self.requests = 0
+        self.fallbacks = 0
+
+    def get_session(self):
+        # created lazily so it binds to the event loop that uses it
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    async def distances(self, origins, destination):
+        return await self.lookup([(origin, destination) for origin in origins])
+
+    async def distances_from(self, origin, destinations):
+        return await self.lookup([(origin, destination) for destination in destinations])
+
+    async def lookup(self, pairs):
+        results = [self.cache.get(origin, destination) for origin, destination in pairs]
+        missing = [i for i, distance in enumerate(results) if distance is None]
+        if len(missing) == 0:
+            return results
+        fetched = await self.fetch([pairs[i] for i in missing])
+        for i, distance in zip(missing, fetched):
+            results[i] = distance
+        return results
+
+    async def fetch(self, pairs):
+        """One request for (origin, destination) pairs that share an origin or a destination."""
+        origins = {origin: row for row, origin in enumerate(dict.fromkeys(origin for origin, _ in pairs))}
+        destinations = {destination: column for column, destination in enumerate(dict.fromkeys(destination for _, destination in pairs))}
+        fallback = haversine([origin[0] for origin, _ in pairs], [origin[1] for origin, _ in pairs],
+                             [destination[0] for _, destination in pairs], [destination[1] for _, destination in pairs]).tolist()
+        params = {
+            "units": "imperial",
+            "origins": "|".join(f"{lat},{long}" for lat, long in origins),
+            "destinations": "|".join(f"{lat},{long}" for lat, long in destinations),
+            "key": self.api_key,
+        }
+        self.requests += 1
+        try:
+            async with self.get_session().get(self.url, params=params) as response:
+                data = await response.json(content_type=None)
+        except (asyncio.TimeoutError, aiohttp.ClientError, ValueError):
+            self.fallbacks += len(pairs)
+            return fallback
+        rows = data.get("rows", [])
+        results = []
+        for i, (origin, destination) in enumerate(pairs):
+            try:
+                # the API always reports distance.value in meters
+                distance = rows[origins[origin]]["elements"][destinations[destination]]["distance"]["value"] * METERS_TO_MILES
+            except (IndexError, KeyError, TypeError):
+                self.fallbacks += 1
+                results.append(fallback[i])
+                continue
+            self.cache.put(origin, destination, distance)
+            results.append(distance)
+        return results
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+
+def make_distance_provider():
+    """Picks the provider from DISTANCE_PROVIDER ("haversine" or "google")."""
+    if os.getenv("DISTANCE_PROVIDER", "haversine") == "google":
+        return DistanceMatrixProvider(
+            os.getenv("GOOGLE_API_KEY"),
+            url=os.getenv("DISTANCE_MATRIX_URL", "https://maps.googleapis.com/maps/api/distancematrix/json"),
+            timeout=float(os.getenv("DISTANCE_TIMEOUT", "2.0")),
+        )
+    return HaversineProvider()
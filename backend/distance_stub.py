@@ -0,0 +1,58 @@
+"""
+Local stand-in for the Google Distance Matrix API.
+
+Answers /maps/api/distancematrix/json with haversine * ROAD_FACTOR so the road
+distance path can be exercised without an API key:
+
+    python distance_stub.py --port 8099 [--delay 0.5]
+    DISTANCE_PROVIDER=google DISTANCE_MATRIX_URL=http://localhost:8099/maps/api/distancematrix/json uvicorn main:app
+"""
+import argparse
+import asyncio
+from aiohttp import web
+from geo import bird_fly_distance, METERS_TO_MILES
+
+ROAD_FACTOR = 1.25
+
+def parse_points(value):
+    points = []
+    for point in value.split("|"):
+        lat, long = point.split(",")
+        points.append((float(lat), float(long)))
+    return points
+
+def make_app(delay=0.0, max_rows=None):
+    """max_rows truncates every answer, like an API response missing some origins."""
+    app = web.Application()
+    app["counts"] = {"requests": 0}
+
+    async def distance_matrix(request):
+        app["counts"]["requests"] += 1
+        if delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            origins = parse_points(request.query["origins"])
+            destinations = parse_points(request.query["destinations"])
+        except (KeyError, ValueError):
+            return web.json_response({"status": "INVALID_REQUEST", "rows": []})
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                miles = bird_fly_distance(origin[0], origin[1], destination[0], destination[1]) * ROAD_FACTOR
+                meters = round(miles / METERS_TO_MILES)
+                elements.append({"status": "OK", "distance": {"text": f"{miles:.1f} mi", "value": meters}})
+            rows.append({"elements": elements})
+        if max_rows is not None:
+            rows = rows[:max_rows]
+        return web.json_response({"status": "OK", "rows": rows})
+
+    app.router.add_get("/maps/api/distancematrix/json", distance_matrix)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.0, help="seconds to wait before answering, to exercise timeouts")
+    args = parser.parse_args()
+    web.run_app(make_app(args.delay), port=args.port)
@@ -0,0 +1,76 @@
+import asyncio
+import logging
+from redis import asyncio as aioredis
+from redis_store import REDIS_URL
+
+class EventBroker:
+    """Fans truck notifications out to SSE clients in this process.
+
+    One pattern subscription on Redis pub/sub feeds an asyncio queue per
+    connected client, so waiting clients cost no Redis traffic at all.
+    """
+    def __init__(self, url, pattern="events:*", queue_size=100):
+        self.url = url
+        self.pattern = pattern
+        self.queue_size = queue_size
+        self.queues = {}
+        self.task = None
+        self.delivered = 0
+        self.dropped = 0
+
+    async def start(self):
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.listen())
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def listen(self):
+        while True:
+            client = aioredis.from_url(self.url)
+            pubsub = client.pubsub()
+            try:
+                await pubsub.psubscribe(self.pattern)
+                async for message in pubsub.listen():
+                    if message["type"] == "pmessage":
+                        truck_id = message["channel"].decode().split(":", 1)[1]
+                        self.dispatch(truck_id, message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Event subscriber lost its Redis connection, reconnecting")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.close()
+                await client.close()
+
+    def dispatch(self, truck_id, event):
+        for queue in self.queues.get(truck_id, ()):
+            if queue.full():
+                # slow client: drop its oldest event rather than block everyone else
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(event)
+            self.delivered += 1
+
+    async def subscribe(self, truck_id):
+        await self.start()
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.queues.setdefault(truck_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, truck_id, queue):
+        queues = self.queues.get(truck_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if len(queues) == 0:
+            del self.queues[truck_id]
+
+    def connections(self):
+        return sum(len(queues) for queues in self.queues.values())
+
+broker = EventBroker(REDIS_URL)
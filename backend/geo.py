@@ -0,0 +1,45 @@
+import math
+import numpy as np
+
+# Radius of the Earth in meters
+EARTH_RADIUS = 6371000
+METERS_TO_MILES = 0.000621371
+
+def bird_fly_distance(truck_lat, truck_long, load_lat, load_long):
+    # Convert degrees to radians
+    truck_lat, truck_long, load_lat, load_long = map(math.radians, [truck_lat, truck_long, load_lat, load_long])
+
+    # Differences
+    diff_lat = load_lat - truck_lat
+    diff_long = load_long - truck_long
+
+    # Haversine formula
+    a = math.sin(diff_lat/2) ** 2 + math.cos(truck_lat) * math.cos(load_lat) * math.sin(diff_long/2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    # Distance in meters
+    distance = EARTH_RADIUS * c
+    # convert to miles
+    distance = distance * METERS_TO_MILES
+    return distance
+
+def haversine(lat1, long1, lat2, long2):
+    """Broadcasting haversine distance in miles between float64 arrays of degrees."""
+    lat1, long1, lat2, long2 = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat1, long1, lat2, long2))
+    diff_lat = lat2 - lat1
+    diff_long = long2 - long1
+    a = np.sin(diff_lat/2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(diff_long/2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return EARTH_RADIUS * c * METERS_TO_MILES
+
+def distances_to(lats, longs, lat, long):
+    """One-to-many: distance from every (lats[i], longs[i]) to a single point, shape (n,)."""
+    return haversine(lats, longs, lat, long)
+
+def distance_matrix(lats1, longs1, lats2, longs2):
+    """Many-to-many: distance from every point of the first set to every point of the second, shape (n, m)."""
+    lats1 = np.asarray(lats1, dtype=np.float64)[:, None]
+    longs1 = np.asarray(longs1, dtype=np.float64)[:, None]
+    lats2 = np.asarray(lats2, dtype=np.float64)[None, :]
+    longs2 = np.asarray(longs2, dtype=np.float64)[None, :]
+    return haversine(lats1, longs1, lats2, longs2)
@@ -1,43 +1,82 @@
-from datetime import datetime
-import math
+from datetime import datetime, timedelta, timezone
 from sklearn.cluster import DBSCAN
 import numpy as np
+from geo import distances_to, distance_matrix
+from stats import stats
+from columnar import ColumnStore
 latestTimestamp = ""
+EPOCH = datetime(1970, 1, 1)
 #############################
 #    ML CLUSTERING MODEL    #
 #############################
+def load_coordinates(load_list):
+    # Extracting load locations, straight from the columns for a ColumnStore
+    if isinstance(load_list, ColumnStore):
+        rows = load_list.live_rows()
+        return np.column_stack((load_list.column('originLatitude')[rows], load_list.column('originLongitude')[rows]))
+    return np.array([(load['originLatitude'], load['originLongitude']) for load in load_list])
+
 def cluster_loads(load_list):
-    # Extracting load locations
-    coordinates = np.array([(load['originLatitude'], load['originLongitude']) for load in load_list])
+    coordinates = load_coordinates(load_list)
     
     # Apply DBSCAN algorithm
-    clustering = DBSCAN(eps=0.1, min_samples=2).fit(coordinates)  # Tune eps and min_samples as needed
+    with stats.timer("dbscan"):
+        clustering = DBSCAN(eps=0.1, min_samples=2).fit(coordinates)  # Tune eps and min_samples as needed
 
     return coordinates, clustering.labels_
 
+def cluster_centroids(cluster_coords, cluster_labels):
+    # Average coordinates of each cluster, ignoring noise points
+    labels = sorted(label for label in set(cluster_labels) if label != -1)
+    if len(labels) == 0:
+        return np.empty((0, 2))
+    return np.array([np.mean(cluster_coords[cluster_labels == label], axis=0) for label in labels])
+
+def nearest_centroid_distance(truck, centroids):
+    if len(centroids) == 0:
+        return float('inf')
+    return distances_to(centroids[:, 0], centroids[:, 1], truck['positionLatitude'], truck['positionLongitude']).min()
+
 def nearest_cluster_distance(truck, cluster_coords, cluster_labels):
-    truck_coords = np.array([truck['positionLatitude'], truck['positionLongitude']])
-    unique_labels = set(cluster_labels)
-    
-    min_distance = float('inf')
-    for label in unique_labels:
-        if label != -1:  # Ignoring noise points
-            # Average coordinates of the cluster
-            cluster_center = np.mean(cluster_coords[cluster_labels == label], axis=0)
-            distance = bird_fly_distance(truck_coords[0], truck_coords[1], cluster_center[0], cluster_center[1])
-            min_distance = min(min_distance, distance)
-    
-    return min_distance
+    return nearest_centroid_distance(truck, cluster_centroids(cluster_coords, cluster_labels))
+
+class LoadClusters:
+    """DBSCAN fit over the open loads, shared by every candidate of a load event.
+
+    The owner of the loads dict calls mark_dirty() whenever a load is added or
+    removed; the model refits once refit_every changes have accumulated.
+    """
+    def __init__(self, refit_every=1):
+        self.refit_every = refit_every
+        self.changes = 0
+        self.centroids = None
+
+    def mark_dirty(self):
+        self.changes += 1
+
+    def reset(self):
+        self.changes = 0
+        self.centroids = None
+
+    def get_centroids(self, load_list):
+        if self.centroids is None or self.changes >= self.refit_every:
+            cluster_coords, cluster_labels = cluster_loads(load_list)
+            self.centroids = cluster_centroids(cluster_coords, cluster_labels)
+            self.changes = 0
+        return self.centroids
+
+def cluster_proximity_score(truck, load, load_list, clusters=None):
+    if clusters is None:
+        centroids = cluster_centroids(*cluster_loads(load_list))
+    else:
+        centroids = clusters.get_centroids(load_list)
 
-def cluster_proximity_score(truck, load, load_list):
-    cluster_coords, cluster_labels = cluster_loads(load_list)
-    
     # Truck's distance to the nearest cluster
-    truck_distance = nearest_cluster_distance(truck, cluster_coords, cluster_labels)
+    truck_distance = nearest_centroid_distance(truck, centroids)
 
     # Load's destination distance to the nearest cluster
     load_destination_coords = np.array([load['destinationLatitude'], load['destinationLongitude']])
-    load_destination_distance = nearest_cluster_distance({'positionLatitude': load_destination_coords[0], 'positionLongitude': load_destination_coords[1]}, cluster_coords, cluster_labels)
+    load_destination_distance = nearest_centroid_distance({'positionLatitude': load_destination_coords[0], 'positionLongitude': load_destination_coords[1]}, centroids)
 
     # Define a threshold for isolation
     isolation_threshold = 100 * 1609.34  # This is in miles, adjust as needed
@@ -62,7 +101,7 @@ def cluster_proximity_score(truck, load, load_list):
 #         HEURISTIC         #
 #############################
 
-def get_score(load, truck, load_list, timestamp, distance):
+def get_score(load, truck, load_list, timestamp, distance, clusters=None):
     data = {}
     global latestTimestamp
     latestTimestamp = timestamp
@@ -81,7 +120,7 @@ def get_score(load, truck, load_list, timestamp, distance):
         idle_score = idle_time_score(load, truck) * 0.4
         weighted_score += idle_score
         before = weighted_score
-        cluster_prox_score = cluster_proximity_score(truck, load, load_list) * 0.2
+        cluster_prox_score = cluster_proximity_score(truck, load, load_list, clusters) * 0.2
         weighted_score += cluster_prox_score
         #print("prox: " , weighted_score - before)
         #print("profit: ", profit_score * 100, "trip: ", trip_length_pref_score*100, "idle: ", idle_score*100, "prox: ", cluster_prox_score*100)
@@ -99,6 +138,110 @@ def get_score(load, truck, load_list, timestamp, distance):
     return data
 
 
+def score_batch(load, candidate_trucks, load_list, timestamp, distances, clusters=None):
+    """Scores every candidate truck for one load at once.
+
+    Same numbers as calling get_score per truck; returns (scores, profits) arrays
+    aligned with candidate_trucks.
+    """
+    n = len(candidate_trucks)
+    if n == 0:
+        return np.empty(0), np.empty(0)
+    truck_lat = np.array([truck['positionLatitude'] for truck in candidate_trucks], dtype=np.float64)
+    truck_long = np.array([truck['positionLongitude'] for truck in candidate_trucks], dtype=np.float64)
+    prefs = np.array([truck['nextTripLengthPreference'] for truck in candidate_trucks])
+    notified = np.array([iso_to_micros(truck['latestNotification']) for truck in candidate_trucks], dtype=np.int64)
+    trip_match = prefs == ('Long' if load['mileage'] >= 200 else 'Short')
+    # idle time in hours
+    idle_hours = np.abs((iso_to_micros(timestamp) - notified) / 1e6 / 3600)
+    return weighted_scores(load, distances, truck_lat, truck_long, trip_match, idle_hours, load_list.values(), clusters)
+
+def score_rows(load, table, rows, load_list, now, distances, clusters=None):
+    """score_batch for trucks kept in a ColumnStore: reads the candidate rows
+    straight from the columns. now and latestNotification are epoch seconds."""
+    if len(rows) == 0:
+        return np.empty(0), np.empty(0)
+    wanted = table.categories['nextTripLengthPreference'].lookup('Long' if load['mileage'] >= 200 else 'Short')
+    trip_match = table.column('nextTripLengthPreference')[rows] == wanted
+    idle_hours = np.abs((now - table.column('latestNotification')[rows]) / 3600)
+    return weighted_scores(load, distances, table.column('positionLatitude')[rows], table.column('positionLongitude')[rows], trip_match, idle_hours, load_list, clusters)
+
+def weighted_scores(load, distances, truck_lat, truck_long, trip_match, idle_hours, load_list, clusters=None):
+    # profit
+    distances = np.asarray(distances, dtype=np.float64)
+    profits = load['price'] - (load['mileage'] * 1.38) - (distances * 1.38)
+    profit_scores = profits / 1000
+
+    scores = profit_scores + trip_match.astype(np.float64) * 0.2 + idle_hours * 0.4
+    if len(load_list) >= 5:
+        if clusters is None:
+            centroids = cluster_centroids(*cluster_loads(load_list))
+        else:
+            centroids = clusters.get_centroids(load_list)
+        scores = scores + cluster_proximity_scores(truck_lat, truck_long, load, centroids) * 0.2
+
+    # Do not evaluate unprofitable loads
+    scores = np.where(profit_scores <= 0, profit_scores, scores)
+    return scores, profits
+
+def score_matrix(load_table, load_rows, truck_table, truck_rows, now, distances, clusters=None):
+    """Scores every truck against every load of a batch in one go.
+
+    distances is a (trucks, loads) array in miles, NaN where the truck is not a
+    candidate for the load; those pairs score -inf. Returns (scores, profits)
+    arrays of the same shape, each column equal to score_rows for its load.
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    price = load_table.column('price')[load_rows]
+    mileage = load_table.column('mileage')[load_rows]
+    profits = price - (mileage * 1.38) - (distances * 1.38)
+    profit_scores = profits / 1000
+
+    preferences = truck_table.categories['nextTripLengthPreference']
+    wanted = np.where(mileage >= 200, preferences.lookup('Long'), preferences.lookup('Short'))
+    trip_match = truck_table.column('nextTripLengthPreference')[truck_rows][:, None] == wanted[None, :]
+    idle_hours = np.abs((now - truck_table.column('latestNotification')[truck_rows]) / 3600)
+
+    scores = profit_scores + trip_match.astype(np.float64) * 0.2 + idle_hours[:, None] * 0.4
+    if len(load_table) >= 5:
+        if clusters is None:
+            centroids = cluster_centroids(*cluster_loads(load_table))
+        else:
+            centroids = clusters.get_centroids(load_table)
+        scores = scores + cluster_proximity_matrix(truck_table.column('positionLatitude')[truck_rows], truck_table.column('positionLongitude')[truck_rows],
+                                                   load_table.column('destinationLatitude')[load_rows], load_table.column('destinationLongitude')[load_rows], centroids) * 0.2
+
+    # Do not evaluate unprofitable loads
+    scores = np.where(profit_scores <= 0, profit_scores, scores)
+    scores = np.where(np.isnan(distances), -np.inf, scores)
+    return scores, profits
+
+def cluster_proximity_scores(truck_lat, truck_long, load, centroids):
+    """Array version of cluster_proximity_score for many trucks and one load."""
+    return cluster_proximity_matrix(truck_lat, truck_long, [load['destinationLatitude']], [load['destinationLongitude']], centroids)[:, 0]
+
+def cluster_proximity_matrix(truck_lat, truck_long, destination_lat, destination_long, centroids):
+    """cluster_proximity_score for every (truck, load destination) pair."""
+    if len(centroids) == 0:
+        truck_distances = np.full(len(truck_lat), np.inf)
+        load_destination_distances = np.full(len(destination_lat), np.inf)
+    else:
+        truck_distances = distance_matrix(truck_lat, truck_long, centroids[:, 0], centroids[:, 1]).min(axis=1)
+        load_destination_distances = distance_matrix(destination_lat, destination_long, centroids[:, 0], centroids[:, 1]).min(axis=1)
+
+    isolation_threshold = 100 * 1609.34
+    is_isolated = truck_distances > isolation_threshold
+    scores = np.where(is_isolated[:, None],
+                      1 / (1 + np.log1p(load_destination_distances))[None, :],
+                      1 / (1 + np.log1p(truck_distances[:, None] + load_destination_distances[None, :])))
+    return np.minimum(scores, 1) / 10
+
+def iso_to_micros(timestamp):
+    """Microseconds since the epoch for an ISO timestamp, naive or offset-bearing."""
+    parsed = datetime.fromisoformat(timestamp)
+    epoch = EPOCH if parsed.tzinfo is None else EPOCH.replace(tzinfo=timezone.utc)
+    return (parsed - epoch) // timedelta(microseconds=1)
+
 def calculate_profit_score(load, truck, data, distance_in_miles):
     """Calculates a score based on estimated profit."""
     # Profit calculation
@@ -122,24 +265,3 @@ def idle_time_score(load, truck):
 
     # Trucks with longer idle times get higher scores
     return time_difference
-
-def bird_fly_distance(truck_lat, truck_long, load_lat, load_long):
-    # Radius of the Earth in meters
-    R = 6371000 
-
-    # Convert degrees to radians
-    truck_lat, truck_long, load_lat, load_long = map(math.radians, [truck_lat, truck_long, load_lat, load_long])
-
-    # Differences
-    diff_lat = load_lat - truck_lat
-    diff_long = load_long - truck_long
-
-    # Haversine formula
-    a = math.sin(diff_lat/2) ** 2 + math.cos(truck_lat) * math.cos(load_lat) * math.sin(diff_long/2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-    # Distance in meters
-    distance = R * c
-    # convert to miles
-    distance = distance * 0.000621371   
-    return distance
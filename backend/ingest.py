@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from stats import stats
+
+#############################
+#      INGEST PIPELINE      #
+#############################
+
+POLICIES = ("block", "drop_newest", "drop_oldest")
+
+class IngestQueue:
+    """Bounded queue between the MQTT callback and a pool of matching workers.
+
+    policy decides what happens when the queue is full:
+      drop_oldest - the oldest queued event is dropped to make room (default)
+      drop_newest - the incoming event is dropped
+      block       - put() awaits a free slot. Only for producers that await
+                    put() themselves, like the replay harness: gmqtt runs each
+                    QoS 0 on_message as its own task, so under the live feed a
+                    blocked put does not slow the broker down, it just leaves
+                    another task waiting (counted in "waiting")
+    With coalesce_trucks, a Truck event whose truckId is already queued replaces
+    the queued payload instead of taking another slot, so only the latest
+    position per truck is processed.
+    """
+    def __init__(self, handler, max_size=10000, workers=1, policy="drop_oldest", coalesce_trucks=True):
+        if policy not in POLICIES:
+            raise ValueError("Unknown ingest policy: " + policy)
+        self.handler = handler
+        self.max_size = max_size
+        self.n_workers = workers
+        self.policy = policy
+        self.coalesce_trucks = coalesce_trucks
+        self.queue = None
+        self.workers = []
+        self.pending_trucks = {}
+        # puts currently blocked on a full queue; a gauge, not reset with the counters
+        self.waiting = 0
+        self.reset_counters()
+
+    def reset_counters(self):
+        self.received = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_depth = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def start(self):
+        # the queue is created here so it binds to the running event loop
+        self.queue = asyncio.Queue(maxsize=self.max_size)
+        self.workers = [asyncio.ensure_future(self.worker()) for _ in range(self.n_workers)]
+
+    async def stop(self, drain=True):
+        if drain and self.queue is not None:
+            await self.queue.join()
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def put(self, payload):
+        self.received += 1
+        if self.coalesce_trucks and payload.get("type") == "Truck":
+            truck_id = payload["truckId"]
+            if truck_id in self.pending_trucks:
+                self.pending_trucks[truck_id] = payload
+                self.coalesced += 1
+                return
+            self.pending_trucks[truck_id] = payload
+            item = (time.monotonic(), truck_id, None)
+        else:
+            item = (time.monotonic(), None, payload)
+
+        if self.policy == "block":
+            self.waiting += 1
+            try:
+                await self.queue.put(item)
+            finally:
+                self.waiting -= 1
+        elif self.queue.full():
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                self.forget(item)
+                return
+            evicted = self.queue.get_nowait()
+            self.queue.task_done()
+            self.forget(evicted)
+            self.queue.put_nowait(item)
+        else:
+            self.queue.put_nowait(item)
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def forget(self, item):
+        truck_id = item[1]
+        if truck_id is not None:
+            self.pending_trucks.pop(truck_id, None)
+
+    async def worker(self):
+        while True:
+            enqueued_at, truck_id, payload = await self.queue.get()
+            if truck_id is not None:
+                payload = self.pending_trucks.pop(truck_id)
+            lag = time.monotonic() - enqueued_at
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+            stats.observe("queue_lag", lag)
+            try:
+                await self.handler(payload)
+            except Exception:
+                self.failed += 1
+                logging.exception("Failed to handle event %s", payload.get("seq"))
+            finally:
+                self.processed += 1
+                self.queue.task_done()
+
+    def stats(self):
+        return {
+            "depth": self.queue.qsize() if self.queue is not None else 0,
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "processed": self.processed,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "waiting": self.waiting,
+            "last_lag_seconds": self.last_lag,
+            "max_lag_seconds": self.max_lag,
+            "avg_lag_seconds": self.total_lag / self.processed if self.processed else 0.0,
+        }
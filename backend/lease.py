@@ -0,0 +1,56 @@
+import os
+import socket
+import time
+import uuid
+
+# only touch the key while we still hold it
+RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+class Lease:
+    """Single-holder lease in Redis, used to elect the one active matcher.
+
+    The holder must renew() well within `ttl` seconds; if it stalls or dies the
+    key expires and a standby process can acquire() it. `expires_at` is the
+    monotonic time by which the key has expired unless renewed again, counted
+    from before the last successful call so it never overestimates.
+    """
+    def __init__(self, redis, key="matcher:lease", ttl=15.0, holder=None):
+        self.redis = redis
+        self.key = key
+        self.ttl = ttl
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.renew_script = redis.register_script(RENEW)
+        self.release_script = redis.register_script(RELEASE)
+        self.expires_at = 0.0
+
+    def acquire(self):
+        started = time.monotonic()
+        acquired = bool(self.redis.set(self.key, self.holder, nx=True, px=int(self.ttl * 1000)))
+        if acquired:
+            self.expires_at = started + self.ttl
+        return acquired
+
+    def renew(self):
+        started = time.monotonic()
+        renewed = bool(self.renew_script(keys=[self.key], args=[self.holder, int(self.ttl * 1000)]))
+        if renewed:
+            self.expires_at = started + self.ttl
+        return renewed
+
+    def release(self):
+        self.release_script(keys=[self.key], args=[self.holder])
+
+    def current_holder(self):
+        value = self.redis.get(self.key)
+        return value.decode() if value else None
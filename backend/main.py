@@ -1,32 +1,43 @@
+import os
 import threading
 from fastapi import FastAPI, BackgroundTasks
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
-from routers import metrics, notify
+from routers import metrics, notify, internal
 import asyncio
-from redis_store import store
-
-import MQTT
+from redis_store import async_store
+from event_broker import broker
 
 app = FastAPI()
 
 import logging
 
+# The matcher normally runs as its own process (python matcher.py) so API
+# workers stay stateless. RUN_MATCHER=1 embeds it for single-process dev runs;
+# the Redis lease still keeps it to one active matcher.
+load_dotenv()
+RUN_MATCHER = os.getenv("RUN_MATCHER", "0") == "1"
+
 def start_MQTT():
-    store.redis.flushall()
+    import matcher
     logging.info('Starting MQTT...')
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
-    loop.run_until_complete(MQTT.main())
-    logging.info('MQTT started.')
+    loop.run_until_complete(matcher.run())
+    logging.info('MQTT stopped.')
 
 @app.on_event("startup")
 async def startup_event():
     logging.info('Starting up...')
-    threading.Thread(target=start_MQTT, daemon=True).start()
+    if RUN_MATCHER:
+        threading.Thread(target=start_MQTT, daemon=True).start()
     logging.info('Startup complete.')
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await broker.close()
+    await async_store.close()
     
-load_dotenv()
 origins = ["*"]
 
 app.add_middleware(
@@ -43,4 +54,5 @@ async def root():
     return {"message": "Hello World"}
 
 app.include_router(metrics.router)
-app.include_router(notify.router)
\ No newline at end of file
+app.include_router(notify.router)
+app.include_router(internal.router)
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Standalone matcher process: MQTT ingestion, matching and notification.
+
+Run exactly this next to any number of API workers:
+
+    python matcher.py
+    uvicorn main:app --workers 8
+
+Several matchers may be started for failover; a lease in Redis makes sure only
+one of them is subscribed and matching at any time, the rest wait on standby.
+
+With SNAPSHOT_PATH set the matcher state is snapshotted every SNAPSHOT_INTERVAL
+seconds and on a clean stop; SNAPSHOT_RESTORE=1 resumes from it on start.
+"""
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+
+import MQTT
+import snapshot
+from lease import Lease
+from redis_store import store
+from stats import stats
+
+LEASE_TTL = float(os.getenv("MATCHER_LEASE_TTL", "15"))
+# number of shard worker processes; 0 matches everything in this process
+SHARDS = int(os.getenv("MATCHER_SHARDS", "0"))
+# the API processes serve these from /internal/stats and /internal/profile;
+# stats are Stats.dump() JSON, merged with the shard workers' matcher:stats:shard<i>
+STATS_KEY = "matcher:stats"
+PROFILE_KEY = "matcher:profile"
+STATS_INTERVAL = float(os.getenv("MATCHER_STATS_INTERVAL", "5"))
+
+async def wait_for_lease(lease):
+    announced = False
+    while not MQTT.STOP.is_set():
+        try:
+            if lease.acquire():
+                return True
+        except Exception:
+            logging.warning("Could not reach Redis for the matcher lease, retrying", exc_info=True)
+            await asyncio.sleep(lease.ttl / 3)
+            continue
+        if not announced:
+            logging.info("Matcher lease held by %s, waiting on standby", lease.current_holder())
+            announced = True
+        await asyncio.sleep(lease.ttl / 3)
+    return False
+
+async def keep_lease(lease):
+    """Renews the lease until stopped; stops the matcher once the lease is lost.
+
+    A failed renewal (Redis unreachable) is retried until just before the lease
+    would expire, so a standby can never take over while we are still matching.
+    """
+    retry = min(1.0, lease.ttl / 15)
+    delay = lease.ttl / 3
+    while not MQTT.STOP.is_set():
+        await asyncio.sleep(delay)
+        try:
+            renewed = lease.renew()
+        except Exception:
+            if time.monotonic() + retry >= lease.expires_at:
+                logging.exception("Could not renew the matcher lease before it expired, stopping")
+                MQTT.STOP.set()
+                return False
+            logging.warning("Matcher lease renewal failed, retrying", exc_info=True)
+            delay = retry
+            continue
+        if not renewed:
+            logging.error("Matcher lease lost, stopping")
+            MQTT.STOP.set()
+            return False
+        delay = lease.ttl / 3
+    return True
+
+async def publish_stats():
+    """Publishes stats and the profile for the API processes; failures only cost a refresh."""
+    while not MQTT.STOP.is_set():
+        await asyncio.sleep(STATS_INTERVAL)
+        try:
+            pipe = store.pipeline()
+            store.set_data(STATS_KEY, json.dumps(stats.dump()), pipe)
+            store.set_data(PROFILE_KEY, stats.profiler.report(), pipe)
+            pipe.execute()
+        except Exception:
+            logging.warning("Failed to publish matcher stats", exc_info=True)
+
+async def keep_snapshots():
+    loop = asyncio.get_running_loop()
+    while not MQTT.STOP.is_set():
+        await asyncio.sleep(snapshot.INTERVAL)
+        # collect on the loop so the state is consistent, write the file off it
+        with stats.timer("snapshot"):
+            arrays = MQTT.snapshot_state()
+        await loop.run_in_executor(None, snapshot.write_snapshot, snapshot.PATH, arrays)
+
+def restore():
+    """Warm start from the last snapshot; shard workers each restore their own partition."""
+    if not snapshot.PATH or not snapshot.RESTORE:
+        return False
+    if SHARDS > 0:
+        # keep redis only if every worker will find its partition; otherwise they all start cold
+        paths = [snapshot.shard_path(snapshot.PATH, index) for index in range(SHARDS)]
+        if all(snapshot.is_recent(path, snapshot.MAX_AGE) for path in paths):
+            return True
+        logging.info("Missing or stale shard snapshots, starting cold")
+        return False
+    return MQTT.restore_snapshot(snapshot.PATH)
+
+async def run():
+    lease = Lease(store.redis, ttl=LEASE_TTL)
+    if not await wait_for_lease(lease):
+        return True
+    logging.info("Matcher lease acquired by %s", lease.holder)
+    router = None
+    snapshots = None
+    publisher = None
+    try:
+        # a fresh leader starts from a clean slate, like a new day, unless it resumes from a snapshot
+        restored = restore()
+        if not restored:
+            store.clear_trucks()
+        if SHARDS > 0:
+            from shards import ShardRouter
+            router = ShardRouter(SHARDS, restore=restored)
+            router.start()
+            MQTT.ingest.handler = router.dispatch
+            stats.add_gauges(lambda: {"shards": router.stats()})
+        elif snapshot.PATH and snapshot.INTERVAL > 0:
+            snapshots = asyncio.ensure_future(keep_snapshots())
+        keeper = asyncio.ensure_future(keep_lease(lease))
+        publisher = asyncio.ensure_future(publish_stats())
+        await MQTT.main()
+        kept = await keeper
+        if kept and router is None and snapshot.PATH:
+            MQTT.save_snapshot(snapshot.PATH)
+        return kept
+    finally:
+        for task in (snapshots, publisher):
+            if task is not None:
+                task.cancel()
+        if router is not None:
+            router.stop()
+        lease.release()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.add_signal_handler(signal.SIGINT, MQTT.ask_exit)
+    loop.add_signal_handler(signal.SIGTERM, MQTT.ask_exit)
+    # a non-zero exit after losing the lease lets the supervisor restart us as a standby
+    sys.exit(0 if loop.run_until_complete(run()) else 1)
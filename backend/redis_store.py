@@ -1,15 +1,224 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
 import redis
+from dotenv import load_dotenv
+from redis import asyncio as aioredis
+
+LATEST_LOADS = 5
+# per-truck rollups outlive the daily truck state; two months of buckets are read
+ROLLUP_FIELDS = ("offered", "offered_mileage", "offered_price", "accepted", "accepted_mileage", "accepted_price")
+ROLLUP_TTL = 62 * 24 * 3600
+# the month of the latest offer, by event time; /metrics reads its buckets on this clock
+MONTH_KEY = "matcher:month"
+
+# Truck state lives in a hash (one JSON-encoded value per field) plus a
+# capped list of the latest notified loads, newest first.
+def truck_key(truck_id):
+    return "truck_metrics_" + str(truck_id)
+
+def latest_loads_key(truck_id):
+    return "truck_metrics_" + str(truck_id) + ":latestLoads"
+
+def encode_fields(fields):
+    return {field: json.dumps(value) for field, value in fields.items()}
+
+# Monthly rollups live in one hash per truck, one "<YYYY-MM>:<counter>" field per
+# counter and month. Not under truck_metrics_, so clear_trucks() keeps them.
+def rollup_key(truck_id):
+    return "truck_rollup_" + str(truck_id)
+
+def accepted_key(truck_id):
+    return "truck_rollup_" + str(truck_id) + ":accepted"
+
+def month_of(epoch_seconds):
+    return time.strftime("%Y-%m", time.gmtime(epoch_seconds))
+
+def month_of_timestamp(timestamp):
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return month_of(parsed.timestamp())
+
+def previous_month(month):
+    year, month = int(month[:4]), int(month[5:])
+    return f"{year - 1}-12" if month == 1 else f"{year}-{month - 1:02d}"
+
+def add_to_rollup(target, truck_id, month, kind, mileage, price):
+    """Counts one offered/accepted load in the month's bucket, O(1) per event."""
+    key = rollup_key(truck_id)
+    target.hincrby(key, f"{month}:{kind}", 1)
+    target.hincrbyfloat(key, f"{month}:{kind}_mileage", mileage)
+    target.hincrbyfloat(key, f"{month}:{kind}_price", price)
+    # the bucket before last month is no longer served
+    stale = previous_month(previous_month(month))
+    target.hdel(key, *(f"{stale}:{field}" for field in ROLLUP_FIELDS))
+    target.expire(key, ROLLUP_TTL)
+
+def decode_rollup(fields):
+    return {field.decode(): float(value) for field, value in fields.items()}
+
+def cooldown_key(truck_id):
+    return "cooldown:" + str(truck_id)
+
+# Claims a truck's notification cooldown on event time: fails while the stored
+# end lies ahead of ARGV[1] (now), otherwise stores ARGV[2] (the new end). The key
+# expiry (ARGV[3] ms) only cleans up; event time decides.
+CLAIM_COOLDOWN = """
+local cooling_until = tonumber(redis.call('get', KEYS[1]) or '0')
+if cooling_until > tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('set', KEYS[1], ARGV[2], 'PX', ARGV[3])
+return 1
+"""
+
+def decode_truck(fields, latest_loads):
+    if not fields:
+        return None
+    truck = {field.decode(): json.loads(value) for field, value in fields.items()}
+    truck["latestLoads"] = [json.loads(load) for load in latest_loads]
+    return truck
 
 class RedisStore:
-    def __init__(self, url):
-        self.redis = redis.from_url(url)
-    
+    """Synchronous store, used by the MQTT matcher thread."""
+    def __init__(self, url, max_connections=None):
+        self.redis = redis.from_url(url, max_connections=max_connections)
+        self.claim_script = self.redis.register_script(CLAIM_COOLDOWN)
+
     def get_data(self, key):
         value = self.redis.get(key)
         return value.decode() if value else None
-    
-    def set_data(self, key, value):
-        self.redis.set(key, value)
 
-# Replace 'redis://localhost:6379' with your actual Redis URL
-store = RedisStore('redis://localhost:6379')
\ No newline at end of file
+    def set_data(self, key, value, pipe=None, ttl=None):
+        self.target(pipe).set(key, value, ex=ttl)
+
+    def pipeline(self):
+        """Batches writes into one round trip; call execute() on the result."""
+        return self.redis.pipeline(transaction=False)
+
+    def target(self, pipe):
+        # an empty pipeline is falsy (it has a __len__), so test against None
+        return pipe if pipe is not None else self.redis
+
+    def publish_event(self, truck_id, event, pipe=None):
+        # picked up by event_broker.EventBroker and pushed to /events/<truck_id>
+        self.target(pipe).publish("events:" + str(truck_id), event)
+
+    def set_truck(self, truck_id, fields, pipe=None):
+        self.target(pipe).hset(truck_key(truck_id), mapping=encode_fields(fields))
+
+    def adopt_truck(self, truck_id, fields, latest_notification, write=True):
+        """Picks up a truck another shard may have held: returns the notification
+        time it already has (None for a new truck). With write, updates `fields`
+        and sets latestNotification only where missing, keeping its latest loads."""
+        pipe = self.pipeline()
+        pipe.hget(truck_key(truck_id), "latestNotification")
+        if write:
+            pipe.hset(truck_key(truck_id), mapping=encode_fields(fields))
+            pipe.hsetnx(truck_key(truck_id), "latestNotification", json.dumps(latest_notification))
+        previous = pipe.execute()[0]
+        return json.loads(previous) if previous else None
+
+    def reset_latest_loads(self, truck_id, pipe=None):
+        self.target(pipe).delete(latest_loads_key(truck_id))
+
+    def push_latest_load(self, truck_id, load, pipe=None):
+        target = pipe if pipe is not None else self.pipeline()
+        target.lpush(latest_loads_key(truck_id), json.dumps(load))
+        target.ltrim(latest_loads_key(truck_id), 0, LATEST_LOADS - 1)
+        if pipe is None:
+            target.execute()
+
+    def record_offer(self, truck_id, month, mileage, price, pipe=None):
+        target = self.target(pipe)
+        add_to_rollup(target, truck_id, month, "offered", mileage, price)
+        target.set(MONTH_KEY, month)
+
+    def claim_cooldowns(self, truck_ids, now, until):
+        """Claims the cooldown of every truck in one round trip; returns a bool per truck."""
+        pipe = self.pipeline()
+        for truck_id in truck_ids:
+            self.claim_script(keys=[cooldown_key(truck_id)], args=[now, until, int((until - now) * 1000) + 60000], client=pipe)
+        return [bool(claimed) for claimed in pipe.execute()]
+
+    def clear_trucks(self):
+        # drops per-truck state only, so the matcher lease and anything else in Redis survive
+        pipe = self.pipeline()
+        for key in self.redis.scan_iter(match="truck_metrics_*", count=1000):
+            pipe.delete(key)
+        pipe.execute()
+
+    def get_truck(self, truck_id):
+        pipe = self.pipeline()
+        pipe.hgetall(truck_key(truck_id))
+        pipe.lrange(latest_loads_key(truck_id), 0, LATEST_LOADS - 1)
+        fields, latest_loads = pipe.execute()
+        return decode_truck(fields, latest_loads)
+
+class AsyncRedisStore:
+    """Non-blocking store for the FastAPI routers, backed by one shared connection pool.
+
+    Connections are opened lazily on the event loop that first uses them.
+    """
+    def __init__(self, url, max_connections=50):
+        self.pool = aioredis.ConnectionPool.from_url(url, max_connections=max_connections)
+        self.redis = aioredis.Redis(connection_pool=self.pool)
+
+    async def get_data(self, key):
+        value = await self.redis.get(key)
+        return value.decode() if value else None
+
+    async def set_data(self, key, value):
+        await self.redis.set(key, value)
+
+    async def get_matching(self, pattern):
+        """Values of every key matching pattern, in one MGET after the scan."""
+        keys = [key async for key in self.redis.scan_iter(match=pattern, count=1000)]
+        if len(keys) == 0:
+            return []
+        return [value.decode() for value in await self.redis.mget(keys) if value]
+
+    def pipeline(self):
+        return self.redis.pipeline(transaction=False)
+
+    async def set_truck(self, truck_id, fields):
+        await self.redis.hset(truck_key(truck_id), mapping=encode_fields(fields))
+
+    async def get_truck(self, truck_id):
+        pipe = self.pipeline()
+        pipe.hgetall(truck_key(truck_id))
+        pipe.lrange(latest_loads_key(truck_id), 0, LATEST_LOADS - 1)
+        fields, latest_loads = await pipe.execute()
+        return decode_truck(fields, latest_loads)
+
+    async def get_truck_metrics(self, truck_id):
+        """Truck state, its rollup counters and the matcher's current month in one round trip."""
+        pipe = self.pipeline()
+        pipe.hgetall(truck_key(truck_id))
+        pipe.lrange(latest_loads_key(truck_id), 0, LATEST_LOADS - 1)
+        pipe.hgetall(rollup_key(truck_id))
+        pipe.get(MONTH_KEY)
+        fields, latest_loads, rollup, month = await pipe.execute()
+        return decode_truck(fields, latest_loads), decode_rollup(rollup), month.decode() if month else None
+
+    async def accept_load(self, truck_id, load_id, month, mileage, price):
+        """Counts an accepted offer once per load; returns False for a repeat."""
+        if not await self.redis.sadd(accepted_key(truck_id), load_id):
+            return False
+        pipe = self.pipeline()
+        pipe.expire(accepted_key(truck_id), ROLLUP_TTL)
+        add_to_rollup(pipe, truck_id, month, "accepted", mileage, price)
+        await pipe.execute()
+        return True
+
+    async def close(self):
+        await self.pool.disconnect()
+
+# Replace 'redis://localhost:6379' with your actual Redis URL, or set REDIS_URL;
+# .env is loaded here too, the entry points import this module before they load it
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+store = RedisStore(REDIS_URL)
+async_store = AsyncRedisStore(REDIS_URL, max_connections=int(os.getenv("REDIS_POOL_SIZE", "50")))
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+
+class Registry:
+    """In-memory id -> record map with expiry on event time.
+
+    Records are kept in order of their last event timestamp (seconds). expire()
+    drops records not seen for `ttl` seconds of event time and max_size drops the
+    least recently seen record once the registry is full. on_evict(key, value,
+    reason) lets the owner clean up side structures like spatial indexes.
+    Timestamps are assumed to arrive roughly in order, as they do on the feed.
+    """
+    def __init__(self, ttl=None, max_size=None, on_evict=None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self.records = OrderedDict()
+        self.seen_at = {}
+        self.added = 0
+        self.evicted = {}
+
+    def __contains__(self, key):
+        return key in self.records
+
+    def __getitem__(self, key):
+        return self.records[key]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def get(self, key, default=None):
+        return self.records.get(key, default)
+
+    def keys(self):
+        return self.records.keys()
+
+    def values(self):
+        return self.records.values()
+
+    def items(self):
+        return self.records.items()
+
+    def put(self, key, value, timestamp):
+        if key not in self.records:
+            self.added += 1
+        self.records[key] = value
+        self.touch(key, timestamp)
+        if self.max_size is not None:
+            while len(self.records) > self.max_size:
+                self.remove(next(iter(self.records)), "capacity")
+
+    def touch(self, key, timestamp):
+        self.seen_at[key] = timestamp
+        self.records.move_to_end(key)
+
+    def remove(self, key, reason="removed"):
+        value = self.records.pop(key, None)
+        if value is None:
+            return None
+        del self.seen_at[key]
+        self.evicted[reason] = self.evicted.get(reason, 0) + 1
+        if self.on_evict is not None:
+            self.on_evict(key, value, reason)
+        return value
+
+    def expire(self, now):
+        """Drops records last seen more than ttl seconds before `now`; returns the evicted keys."""
+        expired = []
+        if self.ttl is None:
+            return expired
+        cutoff = now - self.ttl
+        while len(self.records) > 0:
+            key = next(iter(self.records))
+            if self.seen_at[key] >= cutoff:
+                break
+            self.remove(key, "expired")
+            expired.append(key)
+        return expired
+
+    def clear(self):
+        self.records.clear()
+        self.seen_at.clear()
+
+    def stats(self):
+        return {"live": len(self.records), "added": self.added, "evicted": dict(self.evicted)}
@@ -0,0 +1,243 @@
+"""
+Offline replay of the matching pipeline.
+
+Feeds a JSONL stream of Start/Truck/Load/End events (same format as the live
+feed) through MQTT.on_message and the ingest workers, using an in-process
+broker instead of CloudMQTT and fakeredis instead of a live Redis, then
+reports throughput, per-load match latency (from dequeue to done), the time
+loads waited in the ingest queue before that, and peak memory (process peak
+RSS, so run fleet sizes in increasing order). Needs fakeredis unless
+--live-redis.
+
+With --shards N the events go through the shard router to N worker processes,
+as with MATCHER_SHARDS, and throughput is measured until every worker has
+drained its queue. Workers are separate processes and need a shared Redis, so
+--shards needs --live-redis; per-load latencies are only measured in process.
+
+    python replay.py --trucks 1000,10000,50000 --loads 2000
+    python replay.py --input day.jsonl --speed 60
+    python replay.py --trucks 1000 --loads 500 --write synthetic.jsonl
+    python replay.py --trucks 50000 --loads 2000 --live-redis --shards 1,2,4,8
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import random
+import resource
+import sys
+import time
+from datetime import datetime, timedelta
+
+import MQTT
+from redis_store import store
+
+EQUIP_TYPES = ["Van", "Flatbed", "Reefer"]
+START = datetime(2023, 11, 17, 8, 0, 0)
+
+
+def random_position():
+    return random.uniform(25.0, 49.0), random.uniform(-124.0, -67.0)
+
+
+def synthetic_events(n_trucks, n_loads, pings_per_load=5, seed=13):
+    """A day on the feed: every truck reports, then loads arrive between position pings."""
+    random.seed(seed)
+    seq = 0
+    clock = START
+
+    def event(fields):
+        nonlocal seq
+        seq += 1
+        return {"seq": seq, "timestamp": clock.isoformat(), **fields}
+
+    def truck_event(truck_id):
+        lat, long = random_position()
+        return event({"type": "Truck", "truckId": truck_id, "positionLatitude": lat, "positionLongitude": long,
+                      "equipType": EQUIP_TYPES[truck_id % len(EQUIP_TYPES)],
+                      "nextTripLengthPreference": random.choice(["Long", "Short"])})
+
+    yield event({"type": "Start"})
+    for truck_id in range(n_trucks):
+        yield truck_event(truck_id)
+    for load_id in range(n_loads):
+        clock += timedelta(seconds=random.randint(1, 30))
+        for _ in range(pings_per_load):
+            yield truck_event(random.randrange(n_trucks))
+        origin_lat, origin_long = random_position()
+        destination_lat, destination_long = random_position()
+        mileage = random.uniform(50, 2500)
+        yield event({"type": "Load", "loadId": 40000 + load_id, "originLatitude": origin_lat, "originLongitude": origin_long,
+                     "destinationLatitude": destination_lat, "destinationLongitude": destination_long,
+                     "equipmentType": random.choice(EQUIP_TYPES), "price": round(mileage * random.uniform(1.5, 3.5), 2),
+                     "mileage": round(mileage, 1)})
+    yield event({"type": "End"})
+
+
+def read_events(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def percentile(values, p):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+class LocalBroker:
+    """Delivers events straight to the MQTT callbacks, optionally paced on event time."""
+    def __init__(self, speed=None):
+        self.speed = speed
+
+    async def publish_all(self, events, on_publish):
+        first_event_time = None
+        started = time.perf_counter()
+        for payload in events:
+            if self.speed:
+                event_time = datetime.fromisoformat(payload["timestamp"]).timestamp()
+                if first_event_time is None:
+                    first_event_time = event_time
+                delay = (event_time - first_event_time) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await on_publish(payload)
+            # let the workers run between events, like a network read would;
+            # otherwise the whole stream is queued (and coalesced) up front
+            await asyncio.sleep(0)
+
+
+@contextlib.contextmanager
+def silenced():
+    """Discards stdout at the file descriptor, so shard workers spawned meanwhile inherit it too."""
+    sys.stdout.flush()
+    saved = os.dup(1)
+    with open(os.devnull, "w") as devnull:
+        os.dup2(devnull.fileno(), 1)
+        try:
+            with contextlib.redirect_stdout(devnull):
+                yield
+        finally:
+            os.dup2(saved, 1)
+            os.close(saved)
+
+
+def run_replay(events, speed=None, shards=0):
+    # the handlers print per event; keep that out of the report
+    with silenced():
+        return asyncio.run(replay(events, speed, shards))
+
+
+async def replay(events, speed=None, shards=0):
+    received = {}
+    load_latencies = []
+    queue_waits = []
+    handled = 0
+    original_handler = MQTT.ingest.handler
+    policy = MQTT.ingest.policy
+    router = None
+    if shards > 0:
+        from shards import ShardRouter
+        router = ShardRouter(shards)
+        router.start()
+        # spawning and importing the matcher is not part of the run
+        await asyncio.get_running_loop().run_in_executor(None, router.wait_ready)
+    handle_event = router.dispatch if router is not None else original_handler
+
+    async def timed_handler(payload):
+        nonlocal handled
+        started = time.perf_counter()
+        await handle_event(payload)
+        handled += 1
+        # dispatch only queues the event for a worker, its latency would mean nothing
+        if payload["type"] == "Load" and router is None:
+            load_latencies.append((time.perf_counter() - started) * 1000)
+            queue_waits.append((started - received.pop(payload["seq"])) * 1000)
+
+    async def publish(payload):
+        if payload["type"] == "Load":
+            received[payload["seq"]] = time.perf_counter()
+        await MQTT.on_message(None, "CodeJam", json.dumps(payload).encode(), 0, None)
+
+    MQTT.ingest.handler = timed_handler
+    # the publisher awaits on_message, so blocking is real backpressure here and nothing is dropped
+    MQTT.ingest.policy = "block"
+    MQTT.ingest.reset_counters()
+    MQTT.ingest.start()
+    try:
+        start = time.perf_counter()
+        await LocalBroker(speed).publish_all(events, publish)
+        await MQTT.ingest.stop()
+        if router is not None:
+            # the workers finish their queues before they exit
+            await asyncio.get_running_loop().run_in_executor(None, functools.partial(router.stop, timeout=None))
+        elapsed = time.perf_counter() - start
+    finally:
+        MQTT.ingest.handler = original_handler
+        MQTT.ingest.policy = policy
+        if router is not None and any(process.is_alive() for process in router.processes):
+            router.stop()
+    return handled, elapsed, load_latencies, queue_waits, router.stats() if router is not None else None
+
+
+def report(label, handled, elapsed, load_latencies, queue_waits, shard_stats=None):
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    if shard_stats is None:
+        latency = (f"load p50 {percentile(load_latencies, 50):7.2f} ms p95 {percentile(load_latencies, 95):7.2f} ms "
+                   f"p99 {percentile(load_latencies, 99):7.2f} ms")
+    else:
+        latency = f"{len(shard_stats['routed'])} shard workers"
+    # peak rss is this process only, the shard workers are not counted
+    print(f"{label:>18} | {handled:>8} events | {handled / elapsed:9.1f} events/s | {latency} | peak rss {peak_mb:7.1f} MB")
+    if shard_stats is None:
+        print(f"{'':>18} | queue wait p50 {percentile(queue_waits, 50):7.2f} ms p95 {percentile(queue_waits, 95):7.2f} ms "
+              f"p99 {percentile(queue_waits, 99):7.2f} ms")
+    else:
+        print(f"{'':>18} | shards {shard_stats}")
+    print(f"{'':>18} | ingest {MQTT.ingest.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", help="JSONL file of recorded events; synthetic events are generated when omitted")
+    parser.add_argument("--trucks", default="1000,10000,50000", help="comma separated fleet sizes for synthetic runs")
+    parser.add_argument("--loads", type=int, default=2000, help="loads per synthetic run")
+    parser.add_argument("--speed", type=float, default=None, help="time scale on event timestamps (60 = one hour per minute); as fast as possible when omitted")
+    parser.add_argument("--write", help="write the synthetic stream to this JSONL file instead of replaying it")
+    parser.add_argument("--live-redis", action="store_true",
+                        help="use the configured Redis instead of fakeredis; the replay clears truck_metrics_* keys but "
+                             "leaves its rollups, cooldowns and matcher:* keys behind, so point it at a scratch database")
+    parser.add_argument("--shards", default="0", help="comma separated shard worker counts to compare (needs --live-redis); 0 matches in process")
+    args = parser.parse_args()
+    shard_counts = [int(n) for n in args.shards.split(",")]
+    if any(shard_counts) and not args.live_redis:
+        parser.error("--shards needs --live-redis, the worker processes cannot share fakeredis")
+
+    if args.write:
+        with open(args.write, "w") as f:
+            for payload in synthetic_events(int(args.trucks.split(",")[0]), args.loads):
+                f.write(json.dumps(payload) + "\n")
+        return
+
+    if not args.live_redis:
+        import fakeredis
+        store.redis = fakeredis.FakeRedis()
+
+    for shards in shard_counts:
+        suffix = f", {shards} shards" if shards else ""
+        if args.input:
+            MQTT.end_day()
+            report(args.input + suffix, *run_replay(read_events(args.input), args.speed, shards))
+            continue
+        for n_trucks in [int(n) for n in args.trucks.split(",")]:
+            MQTT.end_day()
+            report(f"{n_trucks} trucks{suffix}", *run_replay(synthetic_events(n_trucks, args.loads), args.speed, shards))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+import json
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from stats import stats, Stats
+from redis_store import async_store
+
+router = APIRouter()
+
+@router.get("/internal/stats", tags=["internal"], response_class=PlainTextResponse)
+async def get_stats():
+    # Prometheus text format: per-stage latency histograms, event counters, queue and registry gauges.
+    # The matcher runs in its own process and publishes its snapshot to Redis every few seconds,
+    # and so does each shard worker (matcher:stats:shard<i>); they are added up into one exposition.
+    dumps = await async_store.get_matching("matcher:stats*")
+    if len(dumps) == 0:
+        return stats.render()
+    return Stats.merge(json.loads(dump) for dump in dumps).render()
+
+@router.get("/internal/profile", tags=["internal"], response_class=PlainTextResponse)
+async def get_profile():
+    # cumulative cProfile report of the sampled events (PROFILE_SAMPLE_RATE)
+    return await async_store.get_data("matcher:profile") or stats.profiler.report()
@@ -1,7 +1,6 @@
 from fastapi import Query, HTTPException, APIRouter
-from redis_store import store
-import random
-import json
+from redis_store import async_store, month_of, month_of_timestamp, previous_month
+import time
 '''
 Earnings overview
 Earnings Breadkown by Load
@@ -45,32 +44,46 @@ LOAD
 }
 '''
 router = APIRouter()
+
+def summarize(rollup, month, prefix=""):
+    """Dashboard figures for one month bucket of a truck's rollup."""
+    def counter(field):
+        return rollup.get(f"{month}:{field}", 0.0)
+    offered = counter("offered")
+    accepted = counter("accepted")
+    return {
+        prefix + "earnings": round(counter("accepted_price"), 2),
+        prefix + "mileage": counter("accepted_mileage"),
+        prefix + "offered_loads": int(offered),
+        prefix + "offered_mileage": counter("offered_mileage"),
+        prefix + "offered_price": round(counter("offered_price"), 2),
+        prefix + "accepted_loads": int(accepted),
+        prefix + "load_acceptance_rate": round(accepted / offered * 100, 1) if offered else 0,
+    }
+
 @router.get("/metrics/{truck_id}", tags=["metrics"])
 async def get_metrics(truck_id: str):
-    # Randomly generate values for the specified metrics
     print("Getting metrics for truck " + str(truck_id))
-    metrics_data = store.get_data("truck_metrics_" + str(truck_id))
-    # metrics_Data should be a dict
+    # truck state and the counters the matcher keeps per month, in a single read
+    metrics_data, rollup, month = await async_store.get_truck_metrics(truck_id)
     
     if(metrics_data is None):
         raise HTTPException(status_code=404, detail="Truck not found")
-    metrics_data = json.loads(metrics_data)
-    if("earnings" not in metrics_data):
-        metrics_data["earnings"] = random.randint(0, 4000)
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps(metrics_data))
-    if("mileage" not in metrics_data):
-        metrics_data["mileage"] = metrics_data["earnings"] * random.randint(50, 88) / 100
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps(metrics_data))
-    if("last_month_earnings" not in metrics_data):
-        metrics_data["last_month_earnings"] = random.randint(0, 4000)
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps(metrics_data))
-    if("last_month_mileage" not in metrics_data):
-        metrics_data["last_month_mileage"] = metrics_data["last_month_earnings"] * random.randint(50, 88) / 100
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps(metrics_data))
-    if("load_acceptance_rate" not in metrics_data):
-        metrics_data["load_acceptance_rate"] = random.randint(0, 100)
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps(metrics_data))
-    if("last_month_load_acceptance_rate" not in metrics_data):
-        metrics_data["last_month_load_acceptance_rate"] = random.randint(0, 100)
-        store.set_data("truck_metrics_" + str(truck_id), json.dumps(metrics_data))
+    # buckets are keyed by event time (a replayed day is not "this month"); wall clock until the first offer
+    if month is None:
+        month = month_of(time.time())
+    metrics_data.update(summarize(rollup, month))
+    metrics_data.update(summarize(rollup, previous_month(month), "last_month_"))
     return metrics_data
+
+@router.post("/metrics/{truck_id}/accept/{load_id}", tags=["metrics"])
+async def accept_load(truck_id: str, load_id: str):
+    truck = await async_store.get_truck(truck_id)
+    if(truck is None):
+        raise HTTPException(status_code=404, detail="Truck not found")
+    # only loads among the truck's latest offers can be accepted; they carry the figures to count
+    offer = next((load for load in truck["latestLoads"] if str(load["loadId"]) == load_id), None)
+    if(offer is None):
+        raise HTTPException(status_code=404, detail="Load was not offered to this truck")
+    accepted = await async_store.accept_load(truck_id, load_id, month_of_timestamp(offer["timestamp"]), offer["mileage"], offer.get("price", 0))
+    return {"accepted": accepted}
@@ -1,26 +1,34 @@
-from fastapi import APIRouter, Depends, Response, status
+from fastapi import APIRouter, Request
 from fastapi.responses import StreamingResponse
-from typing import Generator
-from redis_store import store
-import time
+from typing import AsyncGenerator
+from event_broker import broker
+import asyncio
 
 router = APIRouter()
 
-def event_generator(truck_id: str) -> Generator:
+HEARTBEAT_SECONDS = 15
+
+async def event_generator(request: Request, truck_id: str) -> AsyncGenerator:
     """
     This function generates server-sent events.
     """
-    store.set_data(truck_id, "")
-    while True:
-        # check if new event is available for this truckId in redis
-        event = store.get_data(truck_id)
-        if event is not None:
-            # if new event is available, delete it from redis and yield it
-            store.set_data(truck_id, "")
+    queue = await broker.subscribe(truck_id)
+    try:
+        while True:
+            try:
+                # wait for the shared subscriber to hand us a notification for this truckId
+                event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    break
+                # comment line keeps proxies from closing an idle stream
+                yield ": heartbeat\n\n"
+                continue
             print("Sending event: " + event)
             yield f"data: {event}\n\n"
-        time.sleep(1)
+    finally:
+        broker.unsubscribe(truck_id, queue)
 
 @router.get("/events/{truck_id}", tags=["events"])
-async def get_server_events(truck_id: str):
-    return StreamingResponse(event_generator(truck_id), media_type="text/event-stream")
\ No newline at end of file
+async def get_server_events(request: Request, truck_id: str):
+    return StreamingResponse(event_generator(request, truck_id), media_type="text/event-stream")
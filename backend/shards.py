@@ -0,0 +1,222 @@
+"""
+Sharded matching: one worker process per group of (equipment type, region) shards.
+
+The matcher process keeps decoding and queueing events as usual, but its ingest
+handler becomes ShardRouter.dispatch, which forwards each event to a worker:
+  Load  -> the worker owning (equipmentType, region of the origin)
+  Truck -> the worker owning (equipType, region of the position), plus a
+           "replica" copy to the owners of neighbouring regions when the truck
+           is within BORDER_MILES of their edge, so loads near a border still
+           see the nearest trucks across it
+  Start/End -> every worker
+The router remembers which workers hold each truck; when a move takes a truck
+out of a worker's regions, that worker gets a ForgetTruck event so it does not
+keep offering loads to a copy at the old position.
+Each worker imports MQTT and runs its handlers on its own partition of the
+trucks/loads state. Only the owning worker writes a truck's redis state; the
+notification cooldown is claimed in Redis (MQTT.claim_trucks), so a truck's
+home and replica copies never both offer it a load within the cooldown. With
+snapshots enabled each worker snapshots its own partition to a .shard<index>
+file; on a warm start they restore only if every partition's file is recent,
+otherwise all of them start cold along with redis. A worker that dies is
+restarted (from its own snapshot when there is a recent one) once its queue
+fills up, rather than stalling ingest behind it.
+"""
+import asyncio
+import functools
+import json
+import logging
+import math
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+
+from dotenv import load_dotenv
+
+# spawned workers import this module before MQTT, so load .env here too
+load_dotenv()
+REGION_DEGREES = float(os.getenv("SHARD_REGION_DEGREES", "10"))
+BORDER_MILES = float(os.getenv("SHARD_BORDER_MILES", "150"))
+MILES_PER_DEGREE = 69.05
+
+def region_of(lat, long):
+    return (math.floor(lat / REGION_DEGREES), math.floor(long / REGION_DEGREES))
+
+def regions_near(lat, long, border_miles=BORDER_MILES):
+    """Home region first, then neighbouring regions whose edge is within border_miles."""
+    home = region_of(lat, long)
+    regions = [home]
+    long_miles = MILES_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)
+    for d_lat in (-1, 0, 1):
+        for d_long in (-1, 0, 1):
+            if d_lat == 0 and d_long == 0:
+                continue
+            region = (home[0] + d_lat, home[1] + d_long)
+            low_lat, low_long = region[0] * REGION_DEGREES, region[1] * REGION_DEGREES
+            dy = max(0.0, low_lat - lat, lat - (low_lat + REGION_DEGREES)) * MILES_PER_DEGREE
+            dx = max(0.0, low_long - long, long - (low_long + REGION_DEGREES)) * long_miles
+            if math.hypot(dx, dy) <= border_miles:
+                regions.append(region)
+    return regions
+
+def shard_worker(equip_type, region, n_workers):
+    # crc32 rather than hash() so every process agrees on the placement
+    return zlib.crc32(f"{equip_type}:{region[0]}:{region[1]}".encode()) % n_workers
+
+
+class ShardRouter:
+    # how long a put into a full worker queue waits before checking the worker is alive
+    put_timeout = 1.0
+
+    def __init__(self, n_workers, queue_size=10000, restore=False):
+        self.n_workers = n_workers
+        self.context = multiprocessing.get_context("spawn")
+        # released once by each worker when it is ready to take events
+        self.ready = self.context.Semaphore(0)
+        self.queues = [self.context.Queue(maxsize=queue_size) for _ in range(n_workers)]
+        self.processes = [self.spawn(i, restore) for i in range(n_workers)]
+        self.routed = [0] * n_workers
+        self.replicas = 0
+        self.forgotten = 0
+        self.restarts = 0
+        # truck id -> workers holding a copy of it
+        self.placement = {}
+        # after a warm start any worker may hold a restored copy of a truck not seen yet
+        self.restored = restore
+
+    def spawn(self, worker, restore):
+        return self.context.Process(target=run_worker, args=(worker, self.queues[worker], restore, self.ready), daemon=True)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def wait_ready(self, timeout=None):
+        """Blocks until every worker has imported the matcher and restored its partition."""
+        return all(self.ready.acquire(timeout=timeout) for _ in range(self.n_workers))
+
+    def restart(self, worker):
+        import snapshot
+        logging.error("Shard %d exited with code %s, restarting it", worker, self.processes[worker].exitcode)
+        path = snapshot.shard_path(snapshot.PATH, worker) if snapshot.PATH else None
+        restore = path is not None and snapshot.is_recent(path, snapshot.MAX_AGE)
+        self.processes[worker] = self.spawn(worker, restore)
+        self.processes[worker].start()
+        if restore:
+            # its snapshot may hold trucks that have moved on since, forget them on their next ping
+            for held in self.placement.values():
+                held.add(worker)
+            self.restored = True
+        self.restarts += 1
+
+    def stop(self, timeout=10):
+        for q in self.queues:
+            q.put(None)
+        for process in self.processes:
+            process.join(timeout=timeout)
+
+    def targets(self, payload):
+        """Returns [(worker, is_replica)] for an event."""
+        if payload["type"] == "Load":
+            region = region_of(payload["originLatitude"], payload["originLongitude"])
+            return [(shard_worker(payload["equipmentType"], region, self.n_workers), False)]
+        if payload["type"] == "Truck":
+            regions = regions_near(payload["positionLatitude"], payload["positionLongitude"])
+            home = shard_worker(payload["equipType"], regions[0], self.n_workers)
+            targets = [(home, False)]
+            for region in regions[1:]:
+                worker = shard_worker(payload["equipType"], region, self.n_workers)
+                if all(worker != target for target, _ in targets):
+                    targets.append((worker, True))
+            return targets
+        return [(worker, worker != 0) for worker in range(self.n_workers)]
+
+    async def dispatch(self, payload):
+        """Ingest handler: forwards the event to its shard workers."""
+        targets = self.targets(payload)
+        for worker, is_replica in targets:
+            event = dict(payload, replica=True) if is_replica else payload
+            self.replicas += is_replica
+            self.routed[worker] += 1
+            await self.send(worker, event)
+        if payload["type"] == "Truck":
+            workers = {worker for worker, _ in targets}
+            held = self.placement.get(payload["truckId"])
+            if held is None:
+                held = set(range(self.n_workers)) if self.restored else set()
+            for worker in held - workers:
+                self.forgotten += 1
+                await self.send(worker, {"type": "ForgetTruck", "truckId": payload["truckId"], "seq": payload["seq"],
+                                         "timestamp": payload["timestamp"], "eventTime": payload["eventTime"]})
+            self.placement[payload["truckId"]] = workers
+        elif payload["type"] == "End":
+            self.placement.clear()
+            self.restored = False
+
+    async def send(self, worker, event):
+        try:
+            self.queues[worker].put_nowait(event)
+            return
+        except queue.Full:
+            pass
+        # backpressure: let the ingest queue fill up behind us, but never wait on a dead worker
+        put = functools.partial(self.queues[worker].put, event, timeout=self.put_timeout)
+        while True:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, put)
+                return
+            except queue.Full:
+                if not self.processes[worker].is_alive():
+                    self.restart(worker)
+
+    def stats(self):
+        return {"routed": {str(i): n for i, n in enumerate(self.routed)}, "replicas": self.replicas, "forgotten": self.forgotten,
+                "restarts": self.restarts}
+
+
+def run_worker(index, inbox, restore=False, ready=None):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(worker_loop(index, inbox, restore, ready))
+
+async def worker_loop(index, inbox, restore=False, ready=None):
+    import MQTT
+    MQTT.shared_cooldown = True
+    from redis_store import store
+    from stats import stats
+    loop = asyncio.get_running_loop()
+    snapshot_path = snapshot.shard_path(snapshot.PATH, index) if snapshot.PATH else None
+    # the leader only asks for a restore when every partition has a recent snapshot
+    if snapshot_path and restore:
+        MQTT.restore_snapshot(snapshot_path)
+    if ready is not None:
+        ready.release()
+    last_published = last_snapshot = time.monotonic()
+    while True:
+        payload = await loop.run_in_executor(None, inbox.get)
+        if payload is None:
+            break
+        try:
+            await MQTT.handle_event(payload)
+        except Exception:
+            logging.exception("Shard %d failed to handle event %s", index, payload.get("seq"))
+        # neither a redis error nor a full disk may take the worker down; both are retried next interval
+        if time.monotonic() - last_published > 5:
+            last_published = time.monotonic()
+            try:
+                # expires so a run with fewer shards doesn't keep serving old ones
+                store.set_data(f"matcher:stats:shard{index}", json.dumps(stats.dump()), ttl=60)
+            except Exception:
+                logging.warning("Shard %d failed to publish stats", index, exc_info=True)
+        if snapshot_path and snapshot.INTERVAL > 0 and time.monotonic() - last_snapshot > snapshot.INTERVAL:
+            last_snapshot = time.monotonic()
+            try:
+                MQTT.save_snapshot(snapshot_path)
+            except Exception:
+                logging.exception("Shard %d failed to write its snapshot", index)
+    if MQTT.load_window is not None:
+        await MQTT.load_window.flush()
+    if snapshot_path:
+        MQTT.save_snapshot(snapshot_path)
+    await MQTT.distance_provider.close()
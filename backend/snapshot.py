@@ -0,0 +1,65 @@
+"""
+Warm-start snapshots of matcher state.
+
+The matcher periodically dumps its trucks, open loads, cooldowns and load
+clusters as flat NumPy arrays into one uncompressed .npz file, written to a
+temporary file and renamed over the previous snapshot so a crash never leaves a
+half-written one behind. With SNAPSHOT_RESTORE=1 a new matcher loads it on
+start and matches with the last known fleet right away, instead of waiting for
+every truck to report in again.
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+# imported ahead of MQTT's load_dotenv(), so load .env here before reading it
+load_dotenv()
+# empty disables snapshots
+PATH = os.getenv("SNAPSHOT_PATH", "")
+INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "30"))
+RESTORE = os.getenv("SNAPSHOT_RESTORE", "0") == "1"
+# an older snapshot is ignored on restore, the fleet has moved on since
+MAX_AGE = float(os.getenv("SNAPSHOT_MAX_AGE", "3600"))
+
+def shard_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard{index}{ext}"
+
+def write_snapshot(path, arrays):
+    """Atomically replaces `path` with an .npz holding `arrays` (name -> array)."""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".snapshot-", suffix=".npz")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def is_recent(path, max_age=None):
+    """Whether a snapshot exists at path and is at most max_age seconds old."""
+    try:
+        written = os.path.getmtime(path)
+    except FileNotFoundError:
+        return False
+    return max_age is None or time.time() - written <= max_age
+
+def read_snapshot(path, max_age=None):
+    """The arrays of a snapshot, or None if there is none or it is more than max_age seconds old."""
+    if not is_recent(path, max_age):
+        return None
+    with np.load(path, allow_pickle=False) as snapshot:
+        return {name: snapshot[name] for name in snapshot.files}
+
+def prefixed(prefix, arrays):
+    return {prefix + "." + name: array for name, array in arrays.items()}
+
+def unprefixed(prefix, arrays):
+    start = len(prefix) + 1
+    return {name[start:]: array for name, array in arrays.items() if name.startswith(prefix + ".")}
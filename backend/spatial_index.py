@@ -0,0 +1,139 @@
+import heapq
+import numpy as np
+from sklearn.neighbors import BallTree
+from geo import distances_to
+
+#############################
+#   NEAREST TRUCK LOOKUP    #
+#############################
+
+class TruckIndex:
+    """k-nearest truck lookup for a single equipment type.
+
+    Positions live in a haversine BallTree that is rebuilt lazily. Trucks added
+    or moved since the last build sit in a small pending set that is scanned
+    linearly, and their old tree entries are masked out as stale. The pending
+    and stale sets together never grow past max_dirty, however large the fleet,
+    so a stream of position updates costs a rebuild every max_dirty moves
+    rather than slowing down every lookup.
+    """
+    def __init__(self, min_rebuild=64, rebuild_ratio=0.25, max_dirty=1024):
+        self.min_rebuild = min_rebuild
+        self.rebuild_ratio = rebuild_ratio
+        self.max_dirty = max_dirty
+        self.positions = {}
+        self.tree = None
+        self.tree_ids = []
+        self.tree_rows = {}
+        self.pending = set()
+        self.stale = set()
+        self.pending_coords = None
+
+    def __len__(self):
+        return len(self.positions)
+
+    def add(self, truck_id, lat, long):
+        if truck_id in self.tree_rows:
+            self.stale.add(truck_id)
+        self.positions[truck_id] = (lat, long)
+        self.pending.add(truck_id)
+        self.pending_coords = None
+        self.rebuild_if_dirty()
+
+    def remove(self, truck_id):
+        if truck_id not in self.positions:
+            return
+        del self.positions[truck_id]
+        self.pending.discard(truck_id)
+        self.pending_coords = None
+        if truck_id in self.tree_rows:
+            self.stale.add(truck_id)
+        self.rebuild_if_dirty()
+
+    def rebuild_if_dirty(self):
+        # removals count too: a wave of evictions would otherwise leave most of the tree stale
+        if len(self.pending) + len(self.stale) > min(self.max_dirty, max(self.min_rebuild, self.rebuild_ratio * len(self.tree_ids))):
+            self.rebuild()
+
+    def rebuild(self):
+        self.tree_ids = list(self.positions.keys())
+        self.tree_rows = {truck_id: row for row, truck_id in enumerate(self.tree_ids)}
+        self.pending.clear()
+        self.stale.clear()
+        self.pending_coords = None
+        if len(self.tree_ids) == 0:
+            self.tree = None
+            return
+        coords = np.radians(np.array([self.positions[truck_id] for truck_id in self.tree_ids], dtype=np.float64))
+        self.tree = BallTree(coords, metric="haversine")
+
+    def nearest_pending(self, lat, long, k):
+        if len(self.pending) == 0 or k <= 0:
+            return []
+        if self.pending_coords is None:
+            ids = list(self.pending)
+            self.pending_coords = (ids, np.array([self.positions[truck_id] for truck_id in ids], dtype=np.float64))
+        ids, coords = self.pending_coords
+        dists = distances_to(coords[:, 0], coords[:, 1], lat, long)
+        if len(ids) > k:
+            # keep every pending truck tied with the k-th so the id tie-break below still holds
+            kth = np.partition(dists, k - 1)[k - 1]
+            rows = np.flatnonzero(dists <= kth)
+        else:
+            rows = range(len(ids))
+        return [(dists[row].item(), ids[row]) for row in rows]
+
+    def nearest_in_tree(self, lat, long, k):
+        if self.tree is None or k <= 0:
+            return []
+        n = len(self.tree_ids)
+        # stale rows are masked out; over-fetch a little and widen only if too many were stale
+        query_k = min(k + min(len(self.stale), k), n)
+        while True:
+            _, rows = self.tree.query(np.radians([[lat, long]]), k=query_k)
+            live = [self.tree_ids[row] for row in rows[0] if self.tree_ids[row] not in self.stale]
+            if len(live) >= k or query_k == n:
+                break
+            query_k = min(query_k * 2, n)
+        coords = np.array([self.positions[truck_id] for truck_id in live], dtype=np.float64).reshape(-1, 2)
+        dists = distances_to(coords[:, 0], coords[:, 1], lat, long)
+        return list(zip(dists.tolist(), live))
+
+    def nearest(self, lat, long, k):
+        """Returns up to k (distance, truck_id) pairs sorted like a heap of the same tuples."""
+        # rank by exact distance, ties broken on truck id like a heap of (distance, truck_id)
+        candidates = self.nearest_in_tree(lat, long, k) + self.nearest_pending(lat, long, k)
+        return heapq.nsmallest(k, candidates)
+
+
+class FleetIndex:
+    """One TruckIndex per equipment type."""
+    def __init__(self):
+        self.by_equip = {}
+        self.equip_of = {}
+
+    def __len__(self):
+        return len(self.equip_of)
+
+    def add(self, truck_id, equip_type, lat, long):
+        previous = self.equip_of.get(truck_id)
+        if previous is not None and previous != equip_type:
+            self.by_equip[previous].remove(truck_id)
+        self.equip_of[truck_id] = equip_type
+        if equip_type not in self.by_equip:
+            self.by_equip[equip_type] = TruckIndex()
+        self.by_equip[equip_type].add(truck_id, lat, long)
+
+    def remove(self, truck_id):
+        equip_type = self.equip_of.pop(truck_id, None)
+        if equip_type is not None:
+            self.by_equip[equip_type].remove(truck_id)
+
+    def nearest(self, equip_type, lat, long, k):
+        if equip_type not in self.by_equip:
+            return []
+        return self.by_equip[equip_type].nearest(lat, long, k)
+
+    def clear(self):
+        self.by_equip.clear()
+        self.equip_of.clear()
@@ -0,0 +1,221 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import time
+from bisect import bisect_left
+
+from dotenv import load_dotenv
+
+#############################
+#      INSTRUMENTATION      #
+#############################
+
+# latency buckets in seconds, 10us .. 10s
+BUCKETS = [float(f"{m}e{e}") for e in range(-5, 1) for m in (1, 2.5, 5)] + [10.0]
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is one bisect and two adds."""
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """Approximate percentile, interpolated linearly inside the bucket."""
+        if self.count == 0:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n > 0 and seen + n >= rank:
+                low = BUCKETS[i - 1] if i > 0 else 0.0
+                high = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return BUCKETS[-1]
+
+
+class Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """Opt-in sampling profiler: runs cProfile on a random fraction of events.
+
+    Samples are wall-clock: a handler that awaits lets other tasks run (other
+    ingest workers, the lease keeper, the load window timer) and whatever they
+    do meanwhile is counted in the sample too. Only one sample runs at a time,
+    as cProfile profilers can't nest; events arriving during one are not sampled.
+    """
+    def __init__(self, sample_rate=0.0):
+        self.sample_rate = sample_rate
+        self.stats = None
+        self.sampled = 0
+        self.active = False
+
+    def sample(self):
+        if self.sample_rate <= 0 or self.active or random.random() >= self.sample_rate:
+            return NOOP
+        return ProfiledEvent(self)
+
+    def add(self, profile):
+        self.sampled += 1
+        if self.stats is None:
+            self.stats = pstats.Stats(profile)
+        else:
+            self.stats.add(profile)
+
+    def report(self, limit=40):
+        if self.stats is None:
+            return "no samples (set PROFILE_SAMPLE_RATE, e.g. 0.01)\n"
+        out = io.StringIO()
+        self.stats.stream = out
+        self.stats.sort_stats("cumulative").print_stats(limit)
+        return f"{self.sampled} sampled events\n" + out.getvalue()
+
+
+class ProfiledEvent:
+    def __init__(self, profiler):
+        self.profiler = profiler
+        self.profile = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.active = True
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.profiler.active = False
+        self.profiler.add(self.profile)
+        return False
+
+
+class NoopContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NOOP = NoopContext()
+
+
+class Stats:
+    def __init__(self, prefix="matcher"):
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.gauge_sources = []
+        self.profiler = Profiler(float(os.getenv("PROFILE_SAMPLE_RATE", "0")))
+
+    def histogram(self, stage):
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            histogram = self.histograms[stage] = Histogram()
+        return histogram
+
+    def timer(self, stage):
+        return Timer(self.histogram(stage))
+
+    def observe(self, stage, seconds):
+        self.histogram(stage).observe(seconds)
+
+    def incr(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def add_gauges(self, source):
+        """source() returns a dict of name -> number (nested dicts are flattened with _)."""
+        self.gauge_sources.append(source)
+
+    def dump(self):
+        """JSON-able state, so another process can merge() it (sharded matchers)."""
+        gauges = {}
+        for source in self.gauge_sources:
+            gauges.update(flatten(source()))
+        return {
+            "histograms": {stage: {"counts": h.counts, "count": h.count, "sum": h.sum} for stage, h in self.histograms.items()},
+            "counters": [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+            "gauges": gauges,
+        }
+
+    @classmethod
+    def merge(cls, dumps, prefix="matcher"):
+        """One Stats adding up several dump()s; gauges are summed by name."""
+        merged = cls(prefix)
+        gauges = {}
+        for dump in dumps:
+            for stage, h in dump["histograms"].items():
+                histogram = merged.histogram(stage)
+                histogram.counts = [a + b for a, b in zip(histogram.counts, h["counts"])]
+                histogram.count += h["count"]
+                histogram.sum += h["sum"]
+            for name, labels, value in dump["counters"]:
+                merged.incr(name, value, **labels)
+            for gauge, value in dump["gauges"].items():
+                gauges[gauge] = gauges.get(gauge, 0) + value
+        merged.add_gauges(lambda: gauges)
+        return merged
+
+    def render(self):
+        """Prometheus text exposition format."""
+        lines = []
+        name = self.prefix + "_stage_seconds"
+        lines.append(f"# TYPE {name} histogram")
+        for stage, histogram in sorted(list(self.histograms.items())):
+            cumulative = 0
+            for bound, n in zip(BUCKETS + [float("inf")], histogram.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+        lines.append(f"# TYPE {name}_quantile gauge")
+        for stage, histogram in sorted(list(self.histograms.items())):
+            for q in (50, 95, 99):
+                lines.append(f'{name}_quantile{{stage="{stage}",quantile="0.{q}"}} {histogram.percentile(q)}')
+        typed = set()
+        for (counter, labels), value in sorted(list(self.counters.items())):
+            if counter not in typed:
+                typed.add(counter)
+                lines.append(f"# TYPE {self.prefix}_{counter} counter")
+            label_text = ",".join(f'{k}="{v}"' for k, v in labels)
+            lines.append(f"{self.prefix}_{counter}{{{label_text}}} {value}")
+        for source in self.gauge_sources:
+            for gauge, value in sorted(flatten(source()).items()):
+                lines.append(f"# TYPE {self.prefix}_{gauge} gauge")
+                lines.append(f"{self.prefix}_{gauge} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def flatten(values, prefix=""):
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + "_"))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+# the shared instance reads PROFILE_SAMPLE_RATE as soon as stats is imported, before MQTT loads .env
+load_dotenv()
+stats = Stats()
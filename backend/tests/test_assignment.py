@@ -0,0 +1,46 @@
+from collections import Counter
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from assignment import assign_greedy, assign_hungarian
+
+ASSIGNERS = [assign_greedy, assign_hungarian]
+
+
+def total(scores, pairs):
+    return sum(scores[i, j] for i, j in pairs)
+
+
+def test_hungarian_beats_greedy_on_contention():
+    scores = np.array([[10.0, 9.0], [8.0, 1.0]])
+    assert sorted(assign_greedy(scores, 1)) == [(0, 0), (1, 1)]
+    assert sorted(assign_hungarian(scores, 1)) == [(0, 1), (1, 0)]
+
+
+@pytest.mark.parametrize("assign", ASSIGNERS)
+def test_only_positive_scores_are_offered(assign):
+    scores = np.array([[-1.0, 0.0], [2.0, -3.0]])
+    assert assign(scores, 2) == [(1, 0)]
+    assert assign(np.zeros((3, 2)), 2) == []
+
+
+@pytest.mark.parametrize("assign", ASSIGNERS)
+def test_per_load_cap_keeps_the_best_trucks(assign):
+    scores = np.array([[5.0], [4.0], [3.0]])
+    assert sorted(assign(scores, 2)) == [(0, 0), (1, 0)]
+
+
+@pytest.mark.parametrize("per_load", [1, 3])
+def test_constraints_hold_and_hungarian_is_at_least_greedy(per_load):
+    rng = np.random.default_rng(13)
+    scores = rng.normal(1.0, 2.0, size=(40, 8))
+    results = {assign: assign(scores, per_load) for assign in ASSIGNERS}
+    for pairs in results.values():
+        trucks = [i for i, _ in pairs]
+        assert len(trucks) == len(set(trucks))
+        assert max(Counter(j for _, j in pairs).values()) <= per_load
+        assert all(scores[i, j] > 0 for i, j in pairs)
+    assert total(scores, results[assign_hungarian]) >= total(scores, results[assign_greedy]) - 1e-9
@@ -0,0 +1,57 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from columnar import ColumnStore
+
+
+def truck_table(capacity=4):
+    return ColumnStore({"positionLatitude": np.float64, "nextTripLengthPreference": np.int8},
+                       categorical=("nextTripLengthPreference",), capacity=capacity)
+
+
+def test_removed_rows_are_reused_and_reset():
+    table = truck_table()
+    table.insert(1, positionLatitude=40.0, nextTripLengthPreference="Long")
+    row = table.insert(2, positionLatitude=41.0, nextTripLengthPreference="Short")
+    table.remove(2)
+    assert 2 not in table
+    assert table.insert(3, nextTripLengthPreference="Long") == row
+    # columns not given on insert start from zero, not from the removed row
+    assert table.get(3, "positionLatitude") == 0.0
+    assert table.live_rows().tolist() == [0, 1]
+    assert len(table) == 2
+
+
+def test_insert_of_a_known_id_updates_in_place():
+    table = truck_table()
+    row = table.insert(1, positionLatitude=40.0, nextTripLengthPreference="Long")
+    assert table.insert(1, positionLatitude=42.0) == row
+    assert table.record(1) == {"positionLatitude": 42.0, "nextTripLengthPreference": "Long"}
+
+
+def test_grows_past_capacity():
+    table = truck_table(capacity=2)
+    for truck_id in range(5):
+        table.insert(truck_id, positionLatitude=float(truck_id), nextTripLengthPreference="Short")
+    assert table.capacity() >= 5
+    assert table.column("positionLatitude")[table.rows([0, 4])].tolist() == [0.0, 4.0]
+
+
+def test_export_restore_round_trip():
+    table = truck_table()
+    for truck_id, (lat, preference) in enumerate([(40.0, "Long"), (41.0, "Short"), (42.0, "Long")]):
+        table.insert(truck_id, positionLatitude=lat, nextTripLengthPreference=preference)
+    table.remove(1)
+    # a fresh table codes labels in its own order, restore() must bring the exported ones
+    restored = ColumnStore({"positionLatitude": np.float64, "nextTripLengthPreference": np.int8},
+                           categorical=("nextTripLengthPreference",), capacity=1)
+    restored.insert(99, nextTripLengthPreference="Short")
+    restored.restore(table.export())
+    assert sorted(restored.row_of) == [0, 2]
+    assert 99 not in restored
+    for truck_id in (0, 2):
+        assert restored.record(truck_id) == table.record(truck_id)
+    assert restored.live_rows().tolist() == [0, 1]
+    # rows are packed, the next insert appends after them
+    assert restored.insert(5, nextTripLengthPreference="Short") == 2
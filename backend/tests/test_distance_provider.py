@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("aiohttp")
+
+from aiohttp.test_utils import TestServer
+
+from distance_provider import DistanceMatrixProvider, HaversineProvider
+from distance_stub import ROAD_FACTOR, make_app
+from geo import bird_fly_distance
+
+DESTINATION = (41.88, -87.63)
+ORIGINS = [(39.10, -84.51), (42.33, -83.05), (38.63, -90.20), (43.04, -87.91)]
+
+
+def road_miles(origin, destination=DESTINATION):
+    return bird_fly_distance(origin[0], origin[1], destination[0], destination[1]) * ROAD_FACTOR
+
+
+def with_stub(test, timeout=2.0, **app_options):
+    """Runs test(provider, app) against the stub on a local test server."""
+    async def main():
+        app = make_app(**app_options)
+        server = TestServer(app)
+        await server.start_server()
+        provider = DistanceMatrixProvider("key", url=str(server.make_url("/maps/api/distancematrix/json")), timeout=timeout)
+        try:
+            await test(provider, app)
+        finally:
+            await provider.close()
+            await server.close()
+    asyncio.run(main())
+
+
+def test_one_request_per_load_in_miles():
+    async def test(provider, app):
+        distances = await provider.distances(ORIGINS, DESTINATION)
+        assert app["counts"]["requests"] == 1 and provider.requests == 1
+        # the stub answers in whole meters
+        assert distances == pytest.approx([road_miles(origin) for origin in ORIGINS], abs=1e-3)
+    with_stub(test)
+
+
+def test_cache_hits_on_rounded_coordinates():
+    async def test(provider, app):
+        first = await provider.distances(ORIGINS, DESTINATION)
+        nearby = [(lat + 1e-5, long - 1e-5) for lat, long in ORIGINS]
+        assert await provider.distances(nearby, (DESTINATION[0] + 1e-5, DESTINATION[1])) == first
+        assert app["counts"]["requests"] == 1
+        # only the origin the cache has not seen goes out
+        await provider.distances(ORIGINS + [(35.0, -90.0)], DESTINATION)
+        assert app["counts"]["requests"] == 2
+    with_stub(test)
+
+
+def test_timeout_falls_back_to_haversine():
+    async def test(provider, app):
+        distances = await provider.distances(ORIGINS, DESTINATION)
+        assert distances == await HaversineProvider().distances(ORIGINS, DESTINATION)
+        assert provider.fallbacks == len(ORIGINS)
+        # nothing cached, the next load asks again
+        assert len(provider.cache.entries) == 0
+    with_stub(test, timeout=0.05, delay=0.5)
+
+
+def test_missing_rows_fall_back_per_origin():
+    async def test(provider, app):
+        distances = await provider.distances(ORIGINS, DESTINATION)
+        haversine = await HaversineProvider().distances(ORIGINS, DESTINATION)
+        assert distances[:2] == pytest.approx([road_miles(origin) for origin in ORIGINS[:2]], abs=1e-3)
+        assert distances[2:] == haversine[2:]
+        assert provider.fallbacks == 2
+        assert len(provider.cache.entries) == 2
+    with_stub(test, max_rows=2)
+
+
+def test_one_origin_to_many_destinations_in_one_request():
+    async def test(provider, app):
+        truck = ORIGINS[0]
+        loads = [DESTINATION, ORIGINS[1], ORIGINS[2]]
+        distances = await provider.distances_from(truck, loads)
+        assert app["counts"]["requests"] == 1
+        assert distances == pytest.approx([road_miles(truck, load) for load in loads], abs=1e-3)
+        # same (origin, destination) cache as the per-load path
+        assert await provider.distances([truck], DESTINATION) == distances[:1]
+        assert app["counts"]["requests"] == 1
+        assert await HaversineProvider().distances_from(truck, loads) == pytest.approx(
+            [bird_fly_distance(truck[0], truck[1], load[0], load[1]) for load in loads])
+    with_stub(test)
@@ -0,0 +1,110 @@
+"""The vectorized scorers must give the same numbers as get_score, the reference."""
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from columnar import ColumnStore
+from heuristic import get_score, iso_to_micros, score_batch, score_matrix, score_rows
+
+START = datetime(2023, 11, 17, 8, 0, 0)
+
+
+def random_timestamp(rng):
+    return (START + timedelta(seconds=rng.randint(0, 12 * 3600))).isoformat()
+
+
+def random_load(rng):
+    return {"originLatitude": rng.uniform(25.0, 49.0), "originLongitude": rng.uniform(-124.0, -67.0),
+            "destinationLatitude": rng.uniform(25.0, 49.0), "destinationLongitude": rng.uniform(-124.0, -67.0),
+            "price": rng.uniform(100, 5000), "mileage": rng.uniform(50, 2500)}
+
+
+def random_truck(rng):
+    return {"positionLatitude": rng.uniform(25.0, 49.0), "positionLongitude": rng.uniform(-124.0, -67.0),
+            "nextTripLengthPreference": rng.choice(["Long", "Short"]), "latestNotification": random_timestamp(rng)}
+
+
+def make_fleet(n_trucks, n_loads, seed=13):
+    rng = random.Random(seed)
+    trucks = {truck_id: random_truck(rng) for truck_id in range(n_trucks)}
+    loads = {load_id: random_load(rng) for load_id in range(n_loads)}
+    distances = [rng.uniform(1, 400) for _ in trucks]
+    return trucks, loads, distances, random_timestamp(rng)
+
+
+def as_tables(trucks, loads):
+    truck_table = ColumnStore({"positionLatitude": np.float64, "positionLongitude": np.float64, "nextTripLengthPreference": np.int8, "latestNotification": np.float64},
+                              categorical=("nextTripLengthPreference",))
+    for truck_id, truck in trucks.items():
+        truck_table.insert(truck_id, **dict(truck, latestNotification=iso_to_micros(truck["latestNotification"]) / 1e6))
+    load_table = ColumnStore({"originLatitude": np.float64, "originLongitude": np.float64, "destinationLatitude": np.float64,
+                              "destinationLongitude": np.float64, "price": np.float64, "mileage": np.float64})
+    for load_id, load in loads.items():
+        load_table.insert(load_id, **load)
+    return truck_table, load_table
+
+
+def reference(load, trucks, loads, timestamp, distances):
+    scores = [get_score(load, truck, loads, timestamp, distance) for truck, distance in zip(trucks.values(), distances)]
+    return np.array([data["score"] for data in scores]), np.array([data["profit"] for data in scores])
+
+
+# 3 open loads skips the cluster term, 40 uses it
+@pytest.mark.parametrize("n_loads", [3, 40])
+def test_score_batch_matches_get_score(n_loads):
+    trucks, loads, distances, timestamp = make_fleet(60, n_loads)
+    for load in list(loads.values())[:5]:
+        expected_scores, expected_profits = reference(load, trucks, loads, timestamp, distances)
+        scores, profits = score_batch(load, list(trucks.values()), loads, timestamp, distances)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(profits, expected_profits, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("n_loads", [3, 40])
+def test_score_rows_matches_get_score(n_loads):
+    trucks, loads, distances, timestamp = make_fleet(60, n_loads)
+    truck_table, load_table = as_tables(trucks, loads)
+    now = iso_to_micros(timestamp) / 1e6
+    for load in list(loads.values())[:5]:
+        expected_scores, expected_profits = reference(load, trucks, loads, timestamp, distances)
+        scores, profits = score_rows(load, truck_table, truck_table.rows(list(trucks)), load_table, now, distances)
+        np.testing.assert_allclose(scores, expected_scores, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(profits, expected_profits, rtol=1e-9, atol=1e-9)
+
+
+@pytest.mark.parametrize("n_loads", [3, 40])
+def test_score_matrix_columns_match_get_score(n_loads):
+    trucks, loads, distances, timestamp = make_fleet(60, n_loads)
+    truck_table, load_table = as_tables(trucks, loads)
+    matrix = np.repeat(np.array(distances)[:, None], n_loads, axis=1)
+    scores, profits = score_matrix(load_table, load_table.rows(list(loads)), truck_table, truck_table.rows(list(trucks)),
+                                   iso_to_micros(timestamp) / 1e6, matrix)
+    for j, load in enumerate(list(loads.values())[:5]):
+        expected_scores, expected_profits = reference(load, trucks, loads, timestamp, distances)
+        np.testing.assert_allclose(scores[:, j], expected_scores, rtol=1e-9, atol=1e-9)
+        np.testing.assert_allclose(profits[:, j], expected_profits, rtol=1e-9, atol=1e-9)
+
+
+def test_unprofitable_loads_score_their_profit():
+    trucks, loads, distances, timestamp = make_fleet(20, 10)
+    load = dict(loads[0], price=10.0, mileage=2000.0)
+    expected_scores, expected_profits = reference(load, trucks, loads, timestamp, distances)
+    assert (expected_profits <= 0).all()
+    scores, profits = score_batch(load, list(trucks.values()), loads, timestamp, distances)
+    np.testing.assert_allclose(scores, expected_profits / 1000, rtol=1e-9, atol=1e-9)
+    np.testing.assert_allclose(scores, expected_scores, rtol=1e-9, atol=1e-9)
+
+
+def test_score_matrix_marks_non_candidates():
+    trucks, loads, distances, timestamp = make_fleet(10, 6)
+    truck_table, load_table = as_tables(trucks, loads)
+    matrix = np.full((len(trucks), len(loads)), np.nan)
+    matrix[0, 0] = distances[0]
+    scores, _ = score_matrix(load_table, load_table.rows(list(loads)), truck_table, truck_table.rows(list(trucks)),
+                             iso_to_micros(timestamp) / 1e6, matrix)
+    assert np.isfinite(scores[0, 0])
+    assert np.isneginf(scores).sum() == scores.size - 1
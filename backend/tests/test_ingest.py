@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from ingest import IngestQueue
+
+
+def truck(seq, truck_id):
+    return {"seq": seq, "type": "Truck", "truckId": truck_id}
+
+
+def load(seq):
+    return {"seq": seq, "type": "Load", "loadId": seq}
+
+
+def run(policy, events, max_size=2, coalesce_trucks=True):
+    """Queues every event before the worker gets to run, then drains; returns (handled seqs, stats)."""
+    handled = []
+
+    async def handler(payload):
+        handled.append(payload["seq"])
+
+    async def main():
+        queue = IngestQueue(handler, max_size=max_size, policy=policy, coalesce_trucks=coalesce_trucks)
+        queue.start()
+        for payload in events:
+            await queue.put(payload)
+        await queue.stop()
+        return queue.stats()
+
+    return handled, asyncio.run(main())
+
+
+def test_coalesces_queued_truck_updates():
+    handled, stats = run("drop_oldest", [truck(1, 7), truck(2, 8), truck(3, 7)], max_size=10)
+    # truck 7 keeps its slot but is handled with its latest position
+    assert handled == [3, 2]
+    assert stats["coalesced"] == 1
+    assert stats["dropped"] == 0
+
+
+def test_coalescing_can_be_turned_off():
+    handled, stats = run("drop_oldest", [truck(1, 7), truck(2, 7)], max_size=10, coalesce_trucks=False)
+    assert handled == [1, 2]
+    assert stats["coalesced"] == 0
+
+
+def test_drop_newest_keeps_the_queued_events():
+    handled, stats = run("drop_newest", [load(1), load(2), load(3), truck(4, 7)])
+    assert handled == [1, 2]
+    assert stats["dropped"] == 2
+    assert stats["received"] == 4
+
+
+def test_drop_oldest_makes_room():
+    handled, stats = run("drop_oldest", [truck(1, 7), load(2), load(3), truck(4, 7)])
+    # the dropped truck update no longer counts as pending, so truck 7 is queued again
+    assert handled == [3, 4]
+    assert stats["dropped"] == 2
+    assert stats["max_depth"] == 2
+
+
+def test_block_waits_for_the_worker():
+    handled, stats = run("block", [load(seq) for seq in range(1, 6)])
+    assert handled == [1, 2, 3, 4, 5]
+    assert stats["dropped"] == 0
+    assert stats["waiting"] == 0
+
+
+def test_handler_failures_are_counted():
+    async def handler(payload):
+        raise RuntimeError("boom")
+
+    async def main():
+        queue = IngestQueue(handler, max_size=10)
+        queue.start()
+        await queue.put(load(1))
+        await queue.stop()
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert stats["failed"] == 1
+    assert stats["processed"] == 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        IngestQueue(None, policy="spill")
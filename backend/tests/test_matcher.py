@@ -0,0 +1,72 @@
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("gmqtt")
+
+import MQTT
+import matcher
+
+
+class FlakyLease:
+    """Renewals raise `failures` times, then succeed (or report the lease lost)."""
+    def __init__(self, ttl, failures, lost=False):
+        self.ttl = ttl
+        self.failures = failures
+        self.lost = lost
+        self.calls = 0
+        self.expires_at = time.monotonic() + ttl
+
+    def renew(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("redis is down")
+        if self.lost:
+            return False
+        self.expires_at = time.monotonic() + self.ttl
+        return True
+
+
+def keep(lease, run_for):
+    async def main():
+        keeper = asyncio.ensure_future(matcher.keep_lease(lease))
+        await asyncio.wait([keeper], timeout=run_for)
+        MQTT.STOP.set()
+        return await keeper
+    MQTT.STOP.clear()
+    try:
+        return asyncio.run(main()), MQTT.STOP.is_set()
+    finally:
+        MQTT.STOP.clear()
+
+
+def test_keeper_rides_out_a_redis_blip():
+    lease = FlakyLease(ttl=0.6, failures=2)
+    kept, _ = keep(lease, 1.0)
+    assert kept
+    assert lease.calls > 3
+
+
+def test_keeper_stops_before_the_lease_expires():
+    lease = FlakyLease(ttl=0.6, failures=10 ** 6)
+    started = time.monotonic()
+    deadline = lease.expires_at
+
+    async def main():
+        return await asyncio.wait_for(matcher.keep_lease(lease), timeout=2)
+    MQTT.STOP.clear()
+    try:
+        assert asyncio.run(main()) is False
+        assert MQTT.STOP.is_set()
+        assert time.monotonic() < deadline
+        assert time.monotonic() - started > 0.2
+    finally:
+        MQTT.STOP.clear()
+
+
+def test_keeper_stops_when_the_lease_is_lost():
+    kept, stopped = keep(FlakyLease(ttl=0.3, failures=0, lost=True), 1.0)
+    assert kept is False
+    assert stopped
@@ -0,0 +1,92 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("gmqtt")
+fakeredis = pytest.importorskip("fakeredis")
+
+import MQTT
+from heuristic import iso_to_micros
+from redis_store import latest_loads_key, store, truck_key
+from snapshot import write_snapshot
+
+
+def truck_event(seq, timestamp, replica=False):
+    payload = {"seq": seq, "type": "Truck", "timestamp": timestamp, "eventTime": iso_to_micros(timestamp) / 1e6, "truckId": 7,
+               "positionLatitude": 41.88, "positionLongitude": -87.63, "equipType": "Van", "nextTripLengthPreference": "Long"}
+    if replica:
+        payload["replica"] = True
+    return payload
+
+
+@pytest.fixture
+def local(monkeypatch):
+    monkeypatch.setattr(store, "redis", fakeredis.FakeRedis())
+    MQTT.end_day(clear_redis=False)
+    yield store.redis
+    MQTT.end_day(clear_redis=False)
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    monkeypatch.setattr(store, "redis", fakeredis.FakeRedis())
+    monkeypatch.setattr(MQTT, "shared_cooldown", True)
+    MQTT.end_day(clear_redis=False)
+    yield store.redis
+    MQTT.end_day(clear_redis=False)
+
+
+def test_rehomed_truck_keeps_its_history(sharded):
+    # what the worker that held the truck before left in redis
+    sharded.hset(truck_key(7), "latestNotification", json.dumps("2023-11-17T08:00:00"))
+    sharded.lpush(latest_loads_key(7), json.dumps({"loadId": 1}))
+    asyncio.run(MQTT.dispatch_event(truck_event(1, "2023-11-17T10:00:00")))
+    assert sharded.llen(latest_loads_key(7)) == 1
+    assert json.loads(sharded.hget(truck_key(7), "latestNotification")) == "2023-11-17T08:00:00"
+    assert json.loads(sharded.hget(truck_key(7), "positionLatitude")) == 41.88
+    # idle time is counted from the last notification, not from when this worker first saw it
+    assert MQTT.truck_table.get(7, "latestNotification") == iso_to_micros("2023-11-17T08:00:00") / 1e6
+
+
+def test_new_truck_starts_fresh(sharded):
+    asyncio.run(MQTT.dispatch_event(truck_event(1, "2023-11-17T10:00:00")))
+    assert json.loads(sharded.hget(truck_key(7), "latestNotification")) == "2023-11-17T10:00:00"
+    assert MQTT.truck_table.get(7, "latestNotification") == iso_to_micros("2023-11-17T10:00:00") / 1e6
+
+
+def test_replica_only_reads(sharded):
+    asyncio.run(MQTT.dispatch_event(truck_event(1, "2023-11-17T10:00:00", replica=True)))
+    assert not sharded.exists(truck_key(7))
+    assert 7 in MQTT.trucks
+
+
+def state():
+    """The matcher state a snapshot has to bring back, in comparable form."""
+    return {"clock": (MQTT.latestEventTime, MQTT.latestTimestamp),
+            "trucks": [(truck_id, MQTT.trucks.seen_at[truck_id], truck, MQTT.truck_table.record(truck_id)) for truck_id, truck in MQTT.trucks.items()],
+            "loads": [(load_id, MQTT.loads.seen_at[load_id], load["seq"], load["offeredTo"], MQTT.load_table.record(load_id)) for load_id, load in MQTT.loads.items()],
+            "nearest": MQTT.truck_index.nearest("Van", 41.0, -87.0, 5)}
+
+
+def test_snapshot_restores_the_matcher_state(local, tmp_path):
+    rng = random.Random(5)
+    for seq in range(1, 41):
+        timestamp = f"2023-11-17T{8 + seq // 10:02d}:{seq % 60:02d}:00"
+        if seq % 4 == 0:
+            event = {"seq": seq, "type": "Load", "timestamp": timestamp, "loadId": 1000 + seq, "equipmentType": "Van", "price": 3000.0, "mileage": 400.0,
+                     "originLatitude": rng.uniform(40, 42), "originLongitude": rng.uniform(-88, -86), "destinationLatitude": 39.0, "destinationLongitude": -84.0}
+        else:
+            event = dict(truck_event(seq, timestamp), truckId=seq % 7, positionLatitude=rng.uniform(40, 42), positionLongitude=rng.uniform(-88, -86))
+        event["eventTime"] = iso_to_micros(timestamp) / 1e6
+        asyncio.run(MQTT.dispatch_event(event))
+    before = state()
+    assert any(load[3] for load in before["loads"]), "some load should have been offered"
+    path = str(tmp_path / "matcher.npz")
+    write_snapshot(path, MQTT.snapshot_state())
+    MQTT.end_day(clear_redis=False)
+    assert len(MQTT.trucks) == 0
+    assert MQTT.restore_snapshot(path)
+    assert state() == before
@@ -0,0 +1,22 @@
+import pytest
+
+fakeredis = pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from redis_store import RedisStore
+
+
+@pytest.fixture
+def store():
+    store = RedisStore("redis://localhost:6379")
+    store.redis = fakeredis.FakeRedis()
+    store.claim_script = store.redis.register_script(store.claim_script.script)
+    return store
+
+
+def test_cooldown_is_claimed_once_until_it_runs_out(store):
+    assert store.claim_cooldowns([1, 2], now=100.0, until=1900.0) == [True, True]
+    # another shard offering the same truck within the cooldown loses
+    assert store.claim_cooldowns([2, 3], now=200.0, until=2000.0) == [False, True]
+    # event time decides, not wall clock
+    assert store.claim_cooldowns([1], now=1900.5, until=3700.5) == [True]
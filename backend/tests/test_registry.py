@@ -0,0 +1,50 @@
+from registry import Registry
+
+
+def test_expire_drops_records_older_than_ttl():
+    registry = Registry(ttl=60)
+    registry.put("a", 1, 0)
+    registry.put("b", 2, 30)
+    registry.put("c", 3, 50)
+    assert registry.expire(95) == ["a", "b"]
+    assert list(registry) == ["c"]
+    assert registry.stats()["evicted"] == {"expired": 2}
+
+
+def test_touch_keeps_a_record_alive():
+    registry = Registry(ttl=60)
+    registry.put("a", 1, 0)
+    registry.put("b", 2, 10)
+    registry.touch("a", 40)
+    assert registry.expire(80) == ["b"]
+    assert "a" in registry
+
+
+def test_no_ttl_never_expires():
+    registry = Registry()
+    registry.put("a", 1, 0)
+    assert registry.expire(10 ** 9) == []
+    assert len(registry) == 1
+
+
+def test_capacity_evicts_least_recently_seen():
+    registry = Registry(max_size=2)
+    registry.put("a", 1, 0)
+    registry.put("b", 2, 1)
+    registry.put("a", 10, 2)
+    registry.put("c", 3, 3)
+    assert list(registry.items()) == [("a", 10), ("c", 3)]
+    assert registry.stats() == {"live": 2, "added": 3, "evicted": {"capacity": 1}}
+
+
+def test_on_evict_sees_every_removal_with_its_reason():
+    evicted = []
+    registry = Registry(ttl=10, max_size=2, on_evict=lambda key, value, reason: evicted.append((key, value, reason)))
+    registry.put("a", 1, 0)
+    registry.put("b", 2, 5)
+    registry.put("c", 3, 6)
+    registry.expire(16)
+    registry.remove("c", "moved")
+    assert registry.remove("missing") is None
+    assert evicted == [("a", 1, "capacity"), ("b", 2, "expired"), ("c", 3, "moved")]
+    assert len(registry) == 0
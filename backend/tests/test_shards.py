@@ -0,0 +1,99 @@
+import asyncio
+import queue
+
+import pytest
+
+from shards import ShardRouter, region_of, regions_near
+
+
+def truck_event(seq, lat, long):
+    return {"seq": seq, "type": "Truck", "timestamp": "2023-11-17T08:00:00", "eventTime": 1700208000.0 + seq,
+            "truckId": 7, "positionLatitude": lat, "positionLongitude": long, "equipType": "Van", "nextTripLengthPreference": "Long"}
+
+
+def drain(q):
+    events = []
+    while not q.empty():
+        events.append(q.get_nowait())
+    return events
+
+
+def make_router(n_workers=8):
+    router = ShardRouter(n_workers)
+    # plain queues, no worker processes
+    router.queues = [queue.Queue() for _ in range(n_workers)]
+    return router
+
+
+def test_regions_near_starts_with_home():
+    assert regions_near(41.88, -87.63)[0] == region_of(41.88, -87.63)
+    # the middle of a region is far from every border
+    assert len(regions_near(45.0, -85.0)) == 1
+
+
+def test_moved_truck_is_forgotten_by_workers_that_no_longer_hold_it():
+    router = make_router()
+    asyncio.run(router.dispatch(truck_event(1, 41.88, -87.63)))
+    before = {worker for worker, _ in router.targets(truck_event(1, 41.88, -87.63))}
+    for q in router.queues:
+        drain(q)
+
+    asyncio.run(router.dispatch(truck_event(2, 34.05, -118.24)))
+    after = {worker for worker, _ in router.targets(truck_event(2, 34.05, -118.24))}
+    forgets = {worker for worker, q in enumerate(router.queues) for event in drain(q) if event["type"] == "ForgetTruck"}
+    assert forgets and forgets == before - after
+    assert router.placement[7] == after
+
+
+def test_end_of_day_clears_placement():
+    router = make_router()
+    asyncio.run(router.dispatch(truck_event(1, 41.88, -87.63)))
+    asyncio.run(router.dispatch({"seq": 2, "type": "End", "timestamp": "2023-11-17T20:00:00", "eventTime": 1700251200.0}))
+    assert router.placement == {}
+    assert all(any(event["type"] == "End" for event in drain(q)) for q in router.queues)
+
+
+def test_restored_router_forgets_copies_outside_the_first_targets():
+    router = make_router()
+    router.restored = True
+    asyncio.run(router.dispatch(truck_event(1, 41.88, -87.63)))
+    targets = {worker for worker, _ in router.targets(truck_event(1, 41.88, -87.63))}
+    forgets = {worker for worker, q in enumerate(router.queues) for event in drain(q) if event["type"] == "ForgetTruck"}
+    assert forgets == set(range(8)) - targets
+
+
+class DeadProcess:
+    exitcode = 1
+
+    def is_alive(self):
+        return False
+
+
+class DrainingProcess:
+    """Stands in for a restarted worker: empties its queue when started."""
+    def __init__(self, target, args, daemon):
+        self.inbox = args[1]
+
+    def start(self):
+        drain(self.inbox)
+
+    def is_alive(self):
+        return True
+
+
+class FakeContext:
+    Process = DrainingProcess
+
+
+def test_full_queue_of_a_dead_worker_restarts_it():
+    # restart() looks for the worker's snapshot
+    pytest.importorskip("numpy")
+    router = make_router(2)
+    router.put_timeout = 0.01
+    router.context = FakeContext
+    router.queues[0] = queue.Queue(maxsize=1)
+    router.queues[0].put("backlog")
+    router.processes = [DeadProcess(), DeadProcess()]
+    asyncio.run(asyncio.wait_for(router.send(0, {"type": "Start"}), timeout=5))
+    assert router.restarts == 1
+    assert drain(router.queues[0]) == [{"type": "Start"}]
@@ -0,0 +1,36 @@
+import os
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import snapshot
+
+
+def test_write_read_round_trip(tmp_path):
+    path = str(tmp_path / "matcher.npz")
+    arrays = {"ids": np.array([3, 1, 2]), "names": np.array(["a", "bb", "c"]), "clock": np.array([1700208000.5])}
+    snapshot.write_snapshot(path, arrays)
+    restored = snapshot.read_snapshot(path, max_age=60)
+    assert set(restored) == set(arrays)
+    for name, array in arrays.items():
+        np.testing.assert_array_equal(restored[name], array)
+    # no temporary files left next to it
+    assert os.listdir(tmp_path) == ["matcher.npz"]
+
+
+def test_is_recent(tmp_path):
+    path = str(tmp_path / "matcher.npz")
+    assert not snapshot.is_recent(path)
+    snapshot.write_snapshot(path, {"ids": np.array([1])})
+    assert snapshot.is_recent(path, max_age=60)
+    old = time.time() - 120
+    os.utime(path, (old, old))
+    assert not snapshot.is_recent(path, max_age=60)
+    assert snapshot.is_recent(path)
+    assert snapshot.read_snapshot(path, max_age=60) is None
+
+
+def test_shard_path_keeps_the_extension():
+    assert snapshot.shard_path("/var/lib/matcher.npz", 2) == "/var/lib/matcher.shard2.npz"
@@ -0,0 +1,52 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("sklearn")
+
+from geo import distances_to
+from spatial_index import TruckIndex
+
+
+def brute_force(positions, lat, long, k):
+    ids = list(positions)
+    coords = np.array([positions[truck_id] for truck_id in ids])
+    dists = distances_to(coords[:, 0], coords[:, 1], lat, long)
+    return sorted(zip(dists.tolist(), ids))[:k]
+
+
+def test_nearest_matches_brute_force_while_trucks_move():
+    rng = random.Random(13)
+    index = TruckIndex(max_dirty=50)
+    positions = {}
+    for truck_id in range(2000):
+        positions[truck_id] = (rng.uniform(25, 49), rng.uniform(-124, -67))
+        index.add(truck_id, *positions[truck_id])
+    for step in range(300):
+        truck_id = rng.randrange(2000)
+        if step % 10 == 0:
+            index.remove(truck_id)
+            positions.pop(truck_id, None)
+        else:
+            positions[truck_id] = (rng.uniform(25, 49), rng.uniform(-124, -67))
+            index.add(truck_id, *positions[truck_id])
+        # the dirty sets stay bounded however many updates come in
+        assert len(index.pending) + len(index.stale) <= 50
+        lat, long = rng.uniform(25, 49), rng.uniform(-124, -67)
+        assert [t for _, t in index.nearest(lat, long, 20)] == [t for _, t in brute_force(positions, lat, long, 20)]
+
+
+def test_removals_alone_trigger_a_rebuild():
+    rng = random.Random(7)
+    index = TruckIndex(max_dirty=50)
+    positions = {truck_id: (rng.uniform(25, 49), rng.uniform(-124, -67)) for truck_id in range(1000)}
+    for truck_id, (lat, long) in positions.items():
+        index.add(truck_id, lat, long)
+    # a wave of TTL evictions with no adds in between
+    for truck_id in range(600):
+        index.remove(truck_id)
+        positions.pop(truck_id)
+        assert len(index.stale) <= 50
+    lat, long = rng.uniform(25, 49), rng.uniform(-124, -67)
+    assert index.nearest(lat, long, 20) == brute_force(positions, lat, long, 20)
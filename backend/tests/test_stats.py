@@ -0,0 +1,50 @@
+import asyncio
+
+from stats import NOOP, Profiler, Stats
+
+
+def test_only_one_sample_runs_at_a_time():
+    profiler = Profiler(sample_rate=1.0)
+
+    async def event():
+        with profiler.sample():
+            await asyncio.sleep(0)
+
+    async def main():
+        # interleaved events would nest cProfile profilers without the guard
+        await asyncio.gather(*(event() for _ in range(5)))
+
+    asyncio.run(main())
+    assert profiler.sampled == 1
+    assert not profiler.active
+
+
+def test_sampling_off_by_default():
+    assert Profiler().sample() is NOOP
+
+
+def test_render_includes_timers_and_counters():
+    stats = Stats()
+    with stats.timer("scoring"):
+        pass
+    stats.incr("events_total", type="Load")
+    text = stats.render()
+    assert "scoring" in text
+    assert "events_total" in text
+
+
+def test_merge_adds_up_dumps():
+    first, second = Stats(), Stats()
+    first.observe("scoring", 0.001)
+    second.observe("scoring", 0.002)
+    second.observe("dbscan", 0.05)
+    first.incr("notifications_total", 2, mode="load")
+    second.incr("notifications_total", 3, mode="load")
+    first.add_gauges(lambda: {"trucks": {"live": 10}})
+    second.add_gauges(lambda: {"trucks": {"live": 5}})
+
+    merged = Stats.merge([first.dump(), second.dump()])
+    assert merged.histograms["scoring"].count == 2
+    assert merged.histograms["dbscan"].count == 1
+    assert merged.counters[("notifications_total", (("mode", "load"),))] == 5
+    assert "matcher_trucks_live 15" in merged.render()